@@ -0,0 +1,419 @@
+"""Headless benchmark of PixelRuler's startup, load, zoom, pan, overlay and export paths.
+
+Synthetic images and measurement sets are generated deterministically, every
+scenario runs in a fresh process (so peak RSS is per scenario), and display
+output is stubbed out. Results can be stored as a baseline and compared later:
+
+    python benchmark.py --json baseline.json
+    python benchmark.py --baseline baseline.json     # exits with 1 on regressions
+    python benchmark.py --sizes 1,12,100,400 --measurements 10,100,1000,10000
+"""
+import argparse
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import cv2
+import numpy as np
+try:
+    import resource
+except ImportError:  # Windows: no peak RSS
+    resource = None
+
+import pixelruler
+
+SEED = 1234
+VIEWPORT = (1280, 800)
+ASPECT = 4 / 3
+TEXTURE_SIZE = 512
+FRAME_MEASUREMENTS = 100  # measurements shown during the load, zoom, pan and export scenarios
+ZOOM_STEPS = 40  # wheel steps in, then the same number out
+PAN_STEPS = 120
+OVERLAY_STEPS = 30
+DIALOG_STEPS = 10
+DEFAULT_SIZES = "1,12,48"
+DEFAULT_MEASUREMENTS = "10,1000,10000"
+SCENARIOS = ("startup", "dialog", "load", "zoom", "pan", "overlay", "save", "export")
+
+def get_image_path(work_dir, megapixels):
+    """Get the path of the synthetic image of a size, generating it on first use."""
+    file_path = os.path.join(work_dir, f"synthetic_{megapixels:g}mp_{SEED}.jpg")
+    if not os.path.exists(file_path):
+        print(f"Generating {megapixels:g} MP test image...")
+        cv2.imwrite(file_path, make_image(megapixels), [cv2.IMWRITE_JPEG_QUALITY, 90])
+    return file_path
+
+def make_image(megapixels):
+    """Generate a photo-like image: a smooth random texture with sharp-edged shapes on top."""
+    width = int(round(np.sqrt(megapixels * 1e6 * ASPECT)))
+    height = int(round(megapixels * 1e6 / width))
+    rng = np.random.default_rng(SEED)
+    texture = cv2.GaussianBlur(rng.integers(0, 256, (TEXTURE_SIZE, TEXTURE_SIZE, 3), dtype=np.uint8), (0, 0), 3)
+
+    # Fill tile by tile, so even 400 MP needs no memory beyond the image itself
+    img = np.empty((height, width, 3), dtype=np.uint8)
+    for y in range(0, height, TEXTURE_SIZE):
+        for x in range(0, width, TEXTURE_SIZE):
+            block = img[y:y + TEXTURE_SIZE, x:x + TEXTURE_SIZE]
+            block[:] = texture[:block.shape[0], :block.shape[1]]
+    for _ in range(200):
+        x, y = int(rng.integers(width)), int(rng.integers(height))
+        size = int(rng.integers(20, max(21, min(width, height) // 8)))
+        color = tuple(int(c) for c in rng.integers(0, 256, 3))
+        if rng.random() < 0.5:
+            cv2.rectangle(img, (x, y), (x + size, y + size // 2), color, -1)
+        else:
+            cv2.circle(img, (x, y), size // 2, color, -1)
+    return img
+
+def make_measurements(count, width, height):
+    """Generate a measurement table with every tenth line on a reference object."""
+    rng = np.random.default_rng(SEED + count)
+    reference = pixelruler.REFERENCE_OBJECTS["Credit Card"]
+    entries = []
+    for i in range(count):
+        x0, x1 = rng.uniform(0, width, 2)
+        y0, y1 = rng.uniform(0, height, 2)
+        entries.append({
+            "id": i + 1,
+            "start": {"x": float(x0), "y": float(y0)},
+            "end": {"x": float(x1), "y": float(y1)},
+            "timestamp": "2024-01-01T00:00:00",
+            "reference_object": dict(reference, name="Credit Card") if i % 10 == 0 else None
+        })
+    return pixelruler.recompute_measurements(pixelruler.measurements_from_dicts(entries))
+
+def setup_headless():
+    """Stub out the window and give the viewport a fixed size (worker process)."""
+    cv2.imshow = lambda *args: None
+    pixelruler.window_size = VIEWPORT
+
+def remove_measurement_files(image_path):
+    """Remove measurement files left next to an image by earlier scenarios."""
+    for suffix in ("_measurements.json", "_measurements.journal.jsonl"):
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.splitext(image_path)[0] + suffix)
+
+def open_benchmark_image(image_path, count):
+    """Open an image at full resolution and show count synthetic measurements on it."""
+    remove_measurement_files(image_path)
+    pixelruler.open_image(image_path)
+    wait_for_full_resolution()
+    pixelruler.measurements = make_measurements(count, pixelruler.image_width, pixelruler.image_height)
+    pixelruler.invalidate_geometry()
+
+def wait_for_full_resolution():
+    """Wait until a progressive load has swapped in the full-resolution image."""
+    while pixelruler.image_source_scale != 1:
+        pixelruler.apply_pending_decode()
+        time.sleep(0.001)
+
+def clear_caches():
+    """Forget decoded images and tiles, so the next load starts cold."""
+    with pixelruler.image_cache_lock:
+        pixelruler.image_cache.clear()
+        pixelruler.image_cache_bytes = 0
+    pixelruler.clear_tile_cache()
+
+def render():
+    """Render and present a frame of the current view; returns its duration in seconds."""
+    start = time.perf_counter()
+    pixelruler.needs_redraw = True
+    pixelruler.update_display()
+    return time.perf_counter() - start
+
+def zoom_at(x_screen, y_screen, factor):
+    """Zoom around a screen point, keeping the image point under it in place."""
+    anchor_x, anchor_y = pixelruler.to_image_coords(x_screen, y_screen)
+    min_zoom = min(pixelruler.min_zoom, pixelruler.get_fit_zoom())
+    pixelruler.zoom_factor = max(min_zoom, min(pixelruler.zoom_factor * factor, pixelruler.max_zoom))
+    moved_x, moved_y = pixelruler.to_screen_coords(anchor_x, anchor_y)
+    pixelruler.offset_x += x_screen - moved_x
+    pixelruler.offset_y += y_screen - moved_y
+
+def reset_view():
+    """Fit the image into the viewport."""
+    pixelruler.zoom_factor = pixelruler.get_fit_zoom()
+    pixelruler.offset_x = pixelruler.offset_y = 0
+
+def run_startup(image_path, count, repeat):
+    """Time importing pixelruler in a fresh interpreter, as scripts and batch runs do."""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, "-c", "import pixelruler"], check=True,
+                       cwd=os.path.dirname(os.path.abspath(pixelruler.__file__)))
+        samples.append(time.perf_counter() - start)
+    return [("startup", samples, repeat, "starts/s")]
+
+def run_dialog(image_path, count, repeat):
+    """Time creating the Tk root and opening dialogs on it; skipped without Tk or a display."""
+    try:
+        import tkinter
+        from tkinter import simpledialog
+    except ImportError:  # headless installs without Tk
+        return []
+    start = time.perf_counter()
+    try:
+        root = pixelruler.get_tk_root()
+    except tkinter.TclError:
+        return []
+    tk_root = [time.perf_counter() - start]
+
+    # Close each dialog once it is up; run_dialog records when it was shown
+    def close_dialogs():
+        for child in root.winfo_children():
+            if isinstance(child, tkinter.Toplevel):
+                child.destroy()
+    for _ in range(repeat * DIALOG_STEPS):
+        root.after(50, close_dialogs)
+        pixelruler.run_dialog(simpledialog.askstring, "Benchmark", "Value:")
+    samples = [ms / 1000 for ms in pixelruler.dialog_latencies]
+    return [("tk_root", tk_root, 1, "roots/s"), ("dialog", samples, len(samples), "dialogs/s")]
+
+def run_load(image_path, count, repeat):
+    """Time opening an image until its first frame is shown and until full resolution."""
+    remove_measurement_files(image_path)
+    first_frame, full = [], []
+    for _ in range(repeat):
+        clear_caches()
+        start = time.perf_counter()
+        pixelruler.open_image(image_path)
+        first_frame.append(time.perf_counter() - start)
+        wait_for_full_resolution()
+        full.append(time.perf_counter() - start)
+    megapixels = pixelruler.image_width * pixelruler.image_height / 1e6
+    return [("first_frame", first_frame, megapixels * repeat, "MP/s"),
+            ("load", full, megapixels * repeat, "MP/s")]
+
+def run_zoom(image_path, count, repeat):
+    """Time wheel-zooming in and out around points spread over the viewport, tile cache cold."""
+    open_benchmark_image(image_path, count)
+    rng = np.random.default_rng(SEED)
+    samples = []
+    for _ in range(repeat):
+        clear_caches()
+        reset_view()
+        render()
+        x_screen, y_screen = rng.uniform(0, 1, 2) * (pixelruler.viewport_width, pixelruler.viewport_height)
+        for factor in [1.1] * ZOOM_STEPS + [1 / 1.1] * ZOOM_STEPS:
+            zoom_at(x_screen, y_screen, factor)
+            samples.append(render())
+    return [("zoom", samples, len(samples), "frames/s")]
+
+def run_pan(image_path, count, repeat):
+    """Time dragging the image at 100% zoom along a loop."""
+    open_benchmark_image(image_path, count)
+    samples = []
+    for _ in range(repeat):
+        reset_view()
+        zoom_at(pixelruler.viewport_width / 2, pixelruler.viewport_height / 2, 1 / pixelruler.zoom_factor)
+        render()
+        for step in range(PAN_STEPS):
+            angle = 2 * np.pi * step / PAN_STEPS
+            pixelruler.offset_x += 40 * np.cos(angle)
+            pixelruler.offset_y += 25 * np.sin(2 * angle)
+            samples.append(render())
+    return [("pan", samples, len(samples), "frames/s")]
+
+def run_overlay(image_path, count, repeat):
+    """Time frames after each measurement edit (an endpoint drag), which re-renders the overlay."""
+    open_benchmark_image(image_path, count)
+    reset_view()
+    samples = []
+    table = pixelruler.measurements
+    for step in range(repeat * OVERLAY_STEPS):
+        table["x1"][0] = (step + 1) * pixelruler.image_width / (repeat * OVERLAY_STEPS + 1)
+        pixelruler.invalidate_geometry([0])
+        samples.append(render())
+    return [("overlay", samples, len(samples), "frames/s")]
+
+def run_save(image_path, count, repeat):
+    """Time writing the measurement JSON snapshot."""
+    open_benchmark_image(image_path, count)
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pixelruler.save_measurements()
+        samples.append(time.perf_counter() - start)
+    return [("save", samples, count * repeat, "measurements/s")]
+
+def run_export(image_path, count, repeat):
+    """Time exporting the annotated image at full resolution as PNG."""
+    open_benchmark_image(image_path, count)
+    file_path = os.path.splitext(image_path)[0] + "_annotated.png"
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        pixelruler.export_annotated_image(pixelruler.image, pixelruler.measurements, file_path)
+        samples.append(time.perf_counter() - start)
+    os.remove(file_path)
+    megapixels = pixelruler.image_width * pixelruler.image_height / 1e6
+    return [("export", samples, megapixels * repeat, "MP/s")]
+
+SCENARIO_RUNNERS = {
+    "startup": run_startup,
+    "dialog": run_dialog,
+    "load": run_load,
+    "zoom": run_zoom,
+    "pan": run_pan,
+    "overlay": run_overlay,
+    "save": run_save,
+    "export": run_export
+}
+
+def get_peak_rss_mb():
+    """Get the peak resident set size of this process or its largest child in MB, or None if unknown."""
+    if resource is None:
+        return None
+    peak = max(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+               resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss)
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10  # bytes on macOS, KB elsewhere
+
+def summarize(samples, work, unit):
+    """Get latency percentiles (ms) and throughput of a scenario's samples (seconds)."""
+    ms = np.array(samples) * 1000
+    return {
+        "samples": len(ms),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+        "max_ms": float(ms.max()),
+        "throughput": work / max(1e-9, float(np.sum(samples))),
+        "throughput_unit": unit
+    }
+
+def run_scenario(job):
+    """Run one scenario and summarize it (worker process)."""
+    scenario, image_path, megapixels, count, repeat = job
+    setup_headless()
+    with contextlib.redirect_stdout(io.StringIO()):
+        results = SCENARIO_RUNNERS[scenario](image_path, count, repeat)
+    peak_rss_mb = get_peak_rss_mb()
+    return [dict(summarize(samples, work, unit), scenario=name, megapixels=megapixels,
+                 measurements=count, peak_rss_mb=peak_rss_mb)
+            for name, samples, work, unit in results]
+
+def get_result_key(result):
+    """Identify a result across runs."""
+    return f"{result['scenario']}/{result['megapixels']:g}MP/{result['measurements']}m"
+
+def plan_jobs(args, work_dir):
+    """List the scenario runs: image-bound ones per size, measurement-bound ones per count."""
+    sizes = [float(size) for size in args.sizes.split(",")]
+    counts = [int(count) for count in args.measurements.split(",")]
+    scenarios = args.scenarios.split(",")
+    jobs = [(scenario, None, 0, 0, args.repeat) for scenario in ("startup", "dialog") if scenario in scenarios]
+    for megapixels in sizes:
+        image_path = get_image_path(work_dir, megapixels)
+        for scenario in ("load", "zoom", "pan", "export"):
+            if scenario in scenarios:
+                count = 0 if scenario == "load" else FRAME_MEASUREMENTS
+                jobs.append((scenario, image_path, megapixels, count, args.repeat))
+    image_path = get_image_path(work_dir, sizes[0])
+    for count in counts:
+        for scenario in ("overlay", "save"):
+            if scenario in scenarios:
+                jobs.append((scenario, image_path, sizes[0], count, args.repeat))
+    return jobs
+
+def compare(result, baseline, tolerance):
+    """Compare a result with its baseline; returns (p50 change in %, status)."""
+    if baseline is None:
+        return None, "new"
+    change = 100 * (result["p50_ms"] / max(1e-9, baseline["p50_ms"]) - 1)
+    if change > 100 * tolerance:
+        return change, "SLOWER"
+    if change < -100 * tolerance:
+        return change, "faster"
+    return change, "ok"
+
+def print_report(results, baseline_results, tolerance):
+    """Print one line per result, compared with the baseline if given; returns the regressions."""
+    regressions = []
+    header = f"{'scenario':<12}{'image':>8}{'meas.':>7}{'n':>5}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}" \
+             f"{'throughput':>26}{'peak RSS':>11}"
+    if baseline_results is not None:
+        header += f"{'vs base':>10}  status"
+    print(header)
+    for result in results:
+        rss = f"{result['peak_rss_mb']:.0f} MB" if result["peak_rss_mb"] is not None else "n/a"
+        line = (f"{result['scenario']:<12}{result['megapixels']:>6g}MP{result['measurements']:>7}{result['samples']:>5}"
+                f"{result['p50_ms']:>10.2f}{result['p95_ms']:>10.2f}{result['p99_ms']:>10.2f}"
+                f"{result['throughput']:>11.1f} {result['throughput_unit']:<14}{rss:>11}")
+        if baseline_results is not None:
+            change, status = compare(result, baseline_results.get(get_result_key(result)), tolerance)
+            line += f"{change:>+9.1f}%  {status}" if change is not None else f"{'':>10}  {status}"
+            if status == "SLOWER":
+                regressions.append(get_result_key(result))
+        print(line)
+    return regressions
+
+def parse_args(argv=None):
+    """Parse command-line options."""
+    parser = argparse.ArgumentParser(description="PixelRuler headless benchmark")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES,
+                        help=f"image sizes in megapixels, comma-separated (default: {DEFAULT_SIZES})")
+    parser.add_argument("--measurements", default=DEFAULT_MEASUREMENTS,
+                        help=f"measurement counts for overlay and save, comma-separated (default: {DEFAULT_MEASUREMENTS})")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"scenarios to run (default: {','.join(SCENARIOS)})")
+    parser.add_argument("--repeat", type=int, default=3, help="repetitions per scenario (default: 3)")
+    parser.add_argument("--work-dir", default=os.path.join(tempfile.gettempdir(), "pixelruler_benchmark"),
+                        help="directory for the generated images, reused across runs")
+    parser.add_argument("--json", metavar="FILE", help="write the results as JSON (usable as a baseline)")
+    parser.add_argument("--baseline", metavar="FILE", help="compare with the results of an earlier run")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="relative p50 change counted as a regression (default: 0.10)")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    """Run the benchmark; returns 1 if a scenario regressed against the baseline."""
+    args = parse_args(argv)
+    os.makedirs(args.work_dir, exist_ok=True)
+    baseline_results = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline_results = json.load(f)["results"]
+
+    # One fresh process per scenario: cold caches and a peak RSS of that scenario alone
+    results = []
+    spawn = multiprocessing.get_context("spawn")
+    for job in plan_jobs(args, args.work_dir):
+        scenario, image_path, megapixels, count, _ = job
+        print(f"Running {scenario}" + (f" ({megapixels:g} MP, {count} measurements)..." if image_path else "..."))
+        with ProcessPoolExecutor(max_workers=1, mp_context=spawn) as executor:
+            job_results = executor.submit(run_scenario, job).result()
+        if not job_results:
+            print("  skipped: no display")
+        results.extend(job_results)
+
+    print()
+    regressions = print_report(results, baseline_results, args.tolerance)
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump({
+                "created": datetime.now().isoformat(),
+                "platform": platform.platform(),
+                "python": platform.python_version(),
+                "opencv": cv2.__version__,
+                "numpy": np.__version__,
+                "results": {get_result_key(result): result for result in results}
+            }, f, indent=2)
+        print(f"\nResults written to: {args.json}")
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.tolerance:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,17 @@
 import cv2
 import numpy as np
 import json
-import tkinter as tk
-from tkinter import filedialog, messagebox, simpledialog
+import argparse
 import os
+import time
+import hashlib
+import itertools
+import mmap
+import sqlite3
+import struct
+import zlib
+import threading
+from collections import OrderedDict, deque
 from datetime import datetime
 
 # Global variables
@@ -11,7 +19,37 @@ image = None
 original_image = None
 image_display = None
 points = []
-measurements = []
+# Measurements are stored column-wise: one structured-array row per measurement, with
+# reference objects interned into an append-only table and referenced by index (-1 = none)
+MEASUREMENT_DTYPE = np.dtype([
+    ("id", np.int64),
+    ("x0", np.float64), ("y0", np.float64),
+    ("x1", np.float64), ("y1", np.float64),
+    ("pixel_length", np.float64),
+    ("real_world_length", np.float64),  # NaN without a reference object
+    ("scale_factor", np.float64),       # NaN without a reference object
+    ("reference", np.int32),
+    ("timestamp", "U32"),
+    ("auto_detected", np.bool_),
+    ("rectified_length", np.float64)    # NaN without a plane calibration
+])
+measurements = np.zeros(0, dtype=MEASUREMENT_DTYPE)
+reference_table = []
+reference_index = {}
+
+# Image calibration: one scale fitted to all reference measurements of the image
+CALIBRATION_MAX_ITERATIONS = 10
+CALIBRATION_OUTLIER_MADS = 3.0
+CALIBRATION_MIN_SPREAD = 0.01  # relative error below which lines are never rejected
+image_calibration = None
+
+# Plane calibration: homography from four clicked corners of a known rectangle to plane
+# units; only measurement endpoints are transformed, never the image
+image_plane = None
+plane_mode = False
+plane_points = []
+show_rectified = False
+PLANE_PREVIEW_EXTENT = 5  # rectified preview reaches at most this many reference sizes around it
 show_measurements = True
 window_name = "PixelRuler"
 zoom_factor = 1.0
@@ -25,14 +63,158 @@ last_mouse_y = 0
 current_mouse_x = 0
 current_mouse_y = 0
 current_image_path = ""
+image_width = 0
+image_height = 0
+
+# Progressive loading: a reduced decode is shown first (image holds it, scaled by
+# image_source_scale) while the full decode runs on a worker thread
+PROGRESSIVE_MIN_PIXELS = 8_000_000
+image_source_scale = 1
+image_load_token = 0
+decoded_image_pending = None
+
+# Memory-mapped rasters: large uncompressed TIFFs (strips or tiles, also BigTIFF) and raw
+# dumps are not decoded; image is a MappedRaster that reads only the windows it is asked for
+MAPPED_MIN_BYTES = 256 * 1024 * 1024  # smaller TIFFs are simply decoded by cv2
+RAW_EXTENSIONS = (".raw", ".bin")
+raw_format = None  # {"width", "height", "channels", "dtype", "offset"} from --raw
+TIFF_TYPES = {1: ("B", 1), 3: ("H", 2), 4: ("I", 4), 16: ("Q", 8)}  # BYTE, SHORT, LONG, LONG8
+SAMPLED_DIGEST_MIN_BYTES = 1024 ** 3  # mapped files at least this large get a sampled digest
+
+# Annotated export: PNG is streamed in strips; other formats need the whole image for cv2.imwrite
+EXPORT_MAX_IN_MEMORY_PIXELS = 64_000_000
+SAMPLED_DIGEST_BLOCKS = 256
+SAMPLED_DIGEST_BLOCK_SIZE = 64 * 1024
+
+# Viewport: fixed size from --window, or None to fit the image to the screen
+window_size = None
+screen_size = None
+DEFAULT_SCREEN_SIZE = (1280, 800)
+viewport_width = 0
+viewport_height = 0
+
+# Dialogs: tkinter is imported and one hidden Tk root is created on first use,
+# then shared by all dialogs (headless and batch use never load Tk)
+tk_root = None
+tk_root_ms = None
+dialog_latencies = deque(maxlen=100)  # ms from a dialog call until it is shown
 
 # Performance optimization variables
-last_update_time = 0
-update_interval = 16  # ~60 FPS limit (16ms)
 needs_redraw = True
-cached_scaled_image = None
-cached_zoom = 0
-cached_image_hash = 0
+
+# Frame pacing: redraws are coalesced to at most fps_cap frames per second,
+# and the main loop blocks longer the longer the user stays idle
+fps_cap = 60
+last_frame_time = 0.0
+last_activity_time = 0.0
+IDLE_AFTER = 1.0  # seconds without input before backing off
+MAX_IDLE_WAIT_MS = 250
+loop_wait_deadline = 0.0  # until when the main loop may stay blocked in cv2.waitKey
+
+# Tile pyramid: power-of-two levels split into tiles, kept in a byte-budgeted LRU cache
+TILE_SIZE = 256
+tile_cache = OrderedDict()
+tile_cache_bytes = 0
+tile_cache_budget = 256 * 1024 * 1024  # 256 MB
+tile_cache_lock = threading.RLock()
+
+# Background rendering: the UI thread posts view states, the render thread renders
+# only the latest one into the back buffer and publishes it for the UI thread to show
+render_lock = threading.Lock()
+render_condition = threading.Condition(render_lock)
+render_thread = None
+pending_view = None
+render_busy = False
+frame_ready = False
+back_buffer = None
+
+# Render instrumentation: per-frame stage timings and cache counters for the HUD,
+# optionally streamed to a Chrome trace file (--trace or PIXELRULER_TRACE)
+TRACE_ENV = "PIXELRULER_TRACE"
+STATS_WINDOW = 120  # frames kept for the rolling statistics
+stats_lock = threading.Lock()
+frame_stats = None  # timings of the frame being rendered
+published_stats = None  # timings of the frame waiting to be shown
+frame_history = deque(maxlen=STATS_WINDOW)
+render_counters = {"tile_hits": 0, "tile_misses": 0, "overlay_hits": 0, "overlay_misses": 0,
+                   "image_cache_hits": 0, "image_cache_misses": 0}
+trace_file = None
+trace_start = 0.0
+
+# Measurement overlay layer, rendered with a margin so pure pans only translate it
+MEASUREMENT_COLORS = [(0, 255, 0), (255, 0, 0), (0, 0, 255), (255, 255, 0), (255, 0, 255), (0, 255, 255)]
+OVERLAY_MARGIN = 0.5  # fraction of the viewport on each side
+measurements_version = 0  # bumped on any change the overlay shows
+geometry_version = 0  # bumped only when segments are added, moved or deleted
+overlay_layer = None
+overlay_mask = None
+overlay_version = None
+overlay_zoom = 0
+overlay_offset = (0, 0)
+
+# Cursor layer: rubber-band line and loupe drawn over a copy of the last frame. Before
+# drawing, the regions they cover are saved, and only those are restored on the next move
+LOUPE_SIZE = 160  # screen pixels
+LOUPE_MAGNIFICATION = 4  # relative to the current zoom
+show_loupe = False
+cursor_frame = None
+cursor_patches = []
+cursor_dirty = False
+
+# Edge snapping: refine clicked points to the nearest corner or edge with sub-pixel
+# accuracy, using gradients of a small ROI (cached per grid-aligned ROI)
+SNAP_RADIUS = 12  # screen pixels
+SNAP_MAX_RADIUS = 48  # image pixels
+SNAP_ROI_ALIGN = 32
+SNAP_MIN_EDGE = 16.0  # gradient magnitude (grey levels per pixel)
+SNAP_MIN_CORNER = 0.005  # minimum eigenvalue of the structure tensor (intensities 0..1)
+SNAP_CACHE_SIZE = 32
+snap_enabled = False
+snap_cache = OrderedDict()
+
+# Reference object detection: candidates are searched on a downscaled copy and refined at
+# full resolution only in small ROIs along their outline
+DETECT_MAX_SIDE = 1024  # pixels of the coarse search image
+DETECT_CANNY_LOW, DETECT_CANNY_HIGH = 40, 100
+DETECT_ASPECT_TOLERANCE = 0.06
+DETECT_MAX_ROUNDNESS = 0.05  # std of the outline radius relative to the radius
+DETECT_MAX_RESIDUAL = 0.02  # outline fit residual relative to the object size
+DETECT_MAX_PROPOSALS = 10
+DETECT_OUTLINE_SAMPLES = 8  # edge samples per rectangle side; circles use twice as many
+DETECT_COARSE_ERROR = 3  # coarse-search pixels a candidate outline may be off (blur, dilation)
+DETECT_INLIER_TOLERANCE = 0.005  # outline distance of circle fit inliers, relative to the radius
+
+# Spatial index: uniform grid of the cells each segment crosses (image coordinates), used for
+# hit-testing and overlay culling; updated per edited row, rebuilt lazily per geometry_version
+SPATIAL_GRID_CELLS = 64  # cells along the longer side of the measured area
+HIT_RADIUS = 8  # screen pixels
+segment_index = None
+selected_ids = set()
+dragging = None  # (measurement id, "start" or "end") while an endpoint is dragged
+
+# Measurement journal: one JSON line per add/update/delete, compacted into the snapshot file
+JOURNAL_COMPACT_EVERY = 200  # journal records before compaction
+journal_records = 0
+
+# Session mode: step through a folder or file list while neighbours are decoded in the
+# background into a byte-budgeted LRU cache of decoded images
+session_files = []
+session_index = -1
+image_cache = OrderedDict()
+image_cache_bytes = 0
+image_cache_budget = 1024 * 1024 * 1024  # 1 GB
+image_cache_lock = threading.Lock()
+prefetch_condition = threading.Condition()
+prefetch_queue = []
+prefetch_thread = None
+
+# Stable content digest of the current image file: cache key for rendered tiles
+# and identity of its measurement files
+current_image_digest = None
+MEASUREMENT_STORE_DIR = os.path.join(os.path.expanduser("~"), ".pixelruler", "measurements")
+
+# Optional SQLite store indexing measurements across a whole case (--db)
+measurement_db = None
 
 # Reference object database (expandable)
 REFERENCE_OBJECTS = {
@@ -47,78 +229,631 @@ REFERENCE_OBJECTS = {
     "Custom": {"length": 0, "width": 0, "unit": "mm"}
 }
 
-def load_image():
-    """Load an image and initialize display."""
-    global image, original_image, image_display, zoom_factor, offset_x, offset_y, current_image_path, points, measurements
-    global cached_scaled_image, cached_zoom, cached_image_hash, needs_redraw
+def get_tk_root():
+    """Get the hidden Tk root shared by all dialogs, creating it on first use."""
+    global tk_root, tk_root_ms
+    if tk_root is None:
+        import tkinter as tk
+        start = time.perf_counter()
+        tk_root = tk.Tk()
+        tk_root.withdraw()
+        tk_root_ms = (time.perf_counter() - start) * 1000
+        trace_event("tk_root", start)
+    return tk_root
+
+def run_dialog(dialog, *args, **kwargs):
+    """Show a tkinter dialog on the shared root and return its result."""
+    root = get_tk_root()
+    start = time.perf_counter()
+    shown = []
+    callback = root.after_idle(lambda: shown.append(time.perf_counter()))
+    result = dialog(*args, parent=root, **kwargs)
+    root.after_cancel(callback)
     
-    root = tk.Tk()
-    root.withdraw()
-    file_path = filedialog.askopenfilename(
+    # Process the closed dialog's events now, the OpenCV loop does not run Tk's
+    root.update()
+    if shown:
+        dialog_latencies.append((shown[0] - start) * 1000)
+    trace_event(dialog.__name__, start, args={"open_ms": (shown[0] - start) * 1000 if shown else None})
+    return result
+
+def load_image():
+    """Ask for an image file and open it."""
+    from tkinter import filedialog
+    file_path = run_dialog(
+        filedialog.askopenfilename,
         title="Select image for analysis",
-        filetypes=[("All Images", "*.jpg *.jpeg *.png *.bmp *.tiff"), 
+        filetypes=[("All Images", " ".join(f"*{ext}" for ext in get_image_extensions())), 
                    ("JPEG", "*.jpg *.jpeg"), 
-                   ("PNG", "*.png")]
+                   ("PNG", "*.png"),
+                   ("TIFF", "*.tif *.tiff")]
     )
     if file_path:
+        open_image(file_path)
+
+def read_image_size(file_path):
+    """Read width and height from a JPEG or PNG header without decoding, or None."""
+    try:
+        with open(file_path, "rb") as f:
+            header = f.read(24)
+            if header[:8] == b"\x89PNG\r\n\x1a\n" and header[12:16] == b"IHDR":
+                return struct.unpack(">II", header[16:24])
+            if header[:2] != b"\xff\xd8":
+                return None
+            
+            # Walk the JPEG markers up to the start-of-frame segment
+            f.seek(2)
+            while True:
+                marker = f.read(2)
+                if len(marker) < 2 or marker[0] != 0xFF:
+                    return None
+                if marker[1] in (0xD8, 0x01) or 0xD0 <= marker[1] <= 0xD7:
+                    continue
+                length = struct.unpack(">H", f.read(2))[0]
+                if 0xC0 <= marker[1] <= 0xCF and marker[1] not in (0xC4, 0xC8, 0xCC):
+                    height, width = struct.unpack(">xHH", f.read(5))
+                    return width, height
+                f.seek(length - 2, os.SEEK_CUR)
+    except (OSError, struct.error):
+        return None
+
+def decode_reduced(file_path):
+    """Decode a large JPEG at reduced resolution; returns (image, full width, full height, scale) or None."""
+    if not file_path.lower().endswith((".jpg", ".jpeg")):
+        return None
+    size = read_image_size(file_path)
+    if size is None or size[0] * size[1] < PROGRESSIVE_MIN_PIXELS:
+        return None
+    
+    # Largest reduction that still leaves a usable preview
+    width, height = size
+    for scale, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4), (2, cv2.IMREAD_REDUCED_COLOR_2)):
+        if max(width, height) / scale >= 1500 or scale == 2:
+            break
+    reduced = cv2.imread(file_path, flag)
+    if reduced is None:
+        return None
+    
+    # cv2 applies EXIF orientation, the header does not
+    if (reduced.shape[1] > reduced.shape[0]) != (width > height) and width != height:
+        width, height = height, width
+    return reduced, width, height, scale
+
+class MappedRaster:
+    """Read-only image backed by a memory-mapped uncompressed raster file.
+
+    Supports image[rows, cols] with slices (steps included) like a NumPy array of
+    shape (height, width, 3), but reads only the strips or tiles under the window
+    and returns it as a uint8 BGR array, as cv2.imread would.
+    """
+    ndim = 3
+    dtype = np.dtype(np.uint8)
+    
+    def __init__(self, file_path, layout):
+        self.file_path = file_path
+        self.width, self.height = layout["width"], layout["height"]
+        self.shape = (self.height, self.width, 3)
+        self.channels = layout["channels"]
+        self.sample_dtype = layout["dtype"]
+        self.offsets = layout["offsets"]
+        self.block_width, self.block_height = layout["block_width"], layout["block_height"]
+        self.tiled = layout["block_width"] != layout["width"]
+        self.blocks_across = -(-self.width // self.block_width)
+        self.data = np.memmap(file_path, dtype=np.uint8, mode="r")
+        
+        # Strips stored back to back (the usual case) map as a single array
+        row_bytes = self.width * self.channels * self.sample_dtype.itemsize
+        self.contiguous = None
+        if not self.tiled and all(b - a == self.block_height * row_bytes for a, b in zip(self.offsets, self.offsets[1:])):
+            start = self.offsets[0]
+            self.contiguous = self.data[start:start + self.height * row_bytes].view(self.sample_dtype).reshape(
+                self.height, self.width, self.channels)
+    
+    def __getitem__(self, key):
+        key = key if isinstance(key, tuple) else (key,)
+        rows, cols = key[0], key[1] if len(key) > 1 else slice(None)
+        if len(key) > 2 or not isinstance(rows, slice) or not isinstance(cols, slice):
+            raise IndexError("MappedRaster only supports [rows, cols] slicing")
+        y0, y1, step_y = rows.indices(self.height)
+        x0, x1, step_x = cols.indices(self.width)
+        if step_y <= 0 or step_x <= 0:
+            raise IndexError("MappedRaster does not support negative steps")
+        if self.contiguous is not None:
+            return self.to_bgr(self.contiguous[y0:y1:step_y, x0:x1:step_x])
+        
+        window = np.empty((len(range(y0, y1, step_y)), len(range(x0, x1, step_x)), self.channels),
+                          dtype=self.sample_dtype)
+        for block_y, out_y, local_y in self.split_axis(y0, y1, step_y, self.block_height):
+            for block_x, out_x, local_x in self.split_axis(x0, x1, step_x, self.block_width):
+                block = self.get_block(block_y, block_x)[local_y, local_x]
+                window[out_y:out_y + block.shape[0], out_x:out_x + block.shape[1]] = block
+        return self.to_bgr(window)
+    
+    @staticmethod
+    def split_axis(start, stop, step, block_size):
+        """Split start:stop:step into (block index, output offset, slice within the block) parts."""
+        for block in range(start // block_size, (stop - 1) // block_size + 1 if stop > start else 0):
+            block_start = block * block_size
+            first = max(start, start + -(-(block_start - start) // step) * step)
+            last = min(stop, block_start + block_size)
+            if first < last:
+                yield block, (first - start) // step, slice(first - block_start, last - block_start, step)
+    
+    def get_block(self, block_y, block_x):
+        """Get one strip or tile as an array view into the mapped file."""
+        rows = self.block_height if self.tiled else min(self.block_height, self.height - block_y * self.block_height)
+        offset = self.offsets[block_y * self.blocks_across + block_x]
+        size = rows * self.block_width * self.channels * self.sample_dtype.itemsize
+        return self.data[offset:offset + size].view(self.sample_dtype).reshape(rows, self.block_width, self.channels)
+    
+    def to_bgr(self, window):
+        """Convert raw samples (grey or RGB, optionally with alpha, 8 or 16 bit) to uint8 BGR."""
+        if window.dtype.itemsize == 2:
+            window = (window >> 8).astype(np.uint8)
+        if window.shape[0] == 0 or window.shape[1] == 0:
+            return np.zeros(window.shape[:2] + (3,), dtype=np.uint8)
+        if self.channels <= 2:
+            return cv2.cvtColor(np.ascontiguousarray(window[:, :, 0]), cv2.COLOR_GRAY2BGR)
+        return np.ascontiguousarray(window[:, :, 2::-1])
+
+def read_tiff_layout(file_path):
+    """Read the layout of the first image of an uncompressed TIFF or BigTIFF, or None if it
+    cannot be memory-mapped (compressed, planar, palette, float or not a TIFF at all)."""
+    try:
+        with open(file_path, "rb") as f:
+            header = f.read(16)
+            order = {b"II": "<", b"MM": ">"}.get(header[:2])
+            if order is None:
+                return None
+            version = struct.unpack(order + "H", header[2:4])[0]
+            if version == 42:
+                ifd_offset = struct.unpack(order + "I", header[4:8])[0]
+                count_format, entry_format, offset_format = "H", "HHI4s", "I"
+            elif version == 43:  # BigTIFF
+                ifd_offset = struct.unpack(order + "Q", header[8:16])[0]
+                count_format, entry_format, offset_format = "Q", "HHQ8s", "Q"
+            else:
+                return None
+            inline_size = struct.calcsize(offset_format)
+            f.seek(ifd_offset)
+            count = struct.unpack(order + count_format, f.read(struct.calcsize(count_format)))[0]
+            entry_size = struct.calcsize(order + entry_format)
+            entries = [struct.unpack(order + entry_format, f.read(entry_size)) for _ in range(count)]
+            
+            # Values that do not fit into the entry are stored elsewhere in the file
+            tags = {}
+            for tag, value_type, value_count, value in entries:
+                if value_type not in TIFF_TYPES:
+                    continue
+                value_format, value_size = TIFF_TYPES[value_type]
+                if value_size * value_count > inline_size:
+                    f.seek(struct.unpack(order + offset_format, value)[0])
+                    value = f.read(value_size * value_count)
+                tags[tag] = struct.unpack(f"{order}{value_count}{value_format}", value[:value_size * value_count])
+    except (OSError, struct.error):
+        return None
+    
+    width, height = tags.get(256, (0,))[0], tags.get(257, (0,))[0]
+    channels = tags.get(277, (1,))[0]
+    bits = set(tags.get(258, (1,)))
+    photometric = tags.get(262, (None,))[0]
+    if (not width or not height or tags.get(259, (1,))[0] != 1 or tags.get(284, (1,))[0] != 1 or
+            set(tags.get(339, (1,))) != {1} or bits not in ({8}, {16}) or
+            (photometric, channels) not in ((1, 1), (1, 2), (2, 3), (2, 4))):
+        return None
+    if 322 in tags:
+        block_width, block_height = tags[322][0], tags.get(323, (0,))[0]
+        offsets, byte_counts = tags.get(324, ()), tags.get(325, ())
+    else:
+        block_width, block_height = width, min(height, tags.get(278, (height,))[0])
+        offsets, byte_counts = tags.get(273, ()), tags.get(279, ())
+    if not block_width or not block_height:
+        return None
+    
+    # Every block must be stored uncompressed inside the file
+    dtype = np.dtype(f"{order}u{max(bits) // 8}")
+    block_count = -(-width // block_width) * -(-height // block_height)
+    block_bytes = block_width * block_height * channels * dtype.itemsize
+    last_strip_rows = height - (block_count - 1) * block_height
+    expected = [block_bytes] * (block_count - 1) + [
+        block_bytes if block_width != width else width * last_strip_rows * channels * dtype.itemsize]
+    file_size = os.path.getsize(file_path)
+    if (len(offsets) != block_count or len(byte_counts) != block_count or
+            any(count < size or offset + size > file_size
+                for offset, count, size in zip(offsets, byte_counts, expected))):
+        return None
+    return {"width": width, "height": height, "channels": channels, "dtype": dtype,
+            "offsets": offsets, "block_width": block_width, "block_height": block_height}
+
+def get_raw_layout(file_path):
+    """Get the layout of a raw dump from --raw, or None if the file is too small for it."""
+    width, height, channels = raw_format["width"], raw_format["height"], raw_format["channels"]
+    dtype = np.dtype(raw_format["dtype"]).newbyteorder("<")
+    if os.path.getsize(file_path) < raw_format["offset"] + width * height * channels * dtype.itemsize:
+        print(f"Error: {file_path} is smaller than a {width}x{height}x{channels} {raw_format['dtype']} raster")
+        return None
+    return {"width": width, "height": height, "channels": channels, "dtype": dtype,
+            "offsets": (raw_format["offset"],), "block_width": width, "block_height": height}
+
+def open_mapped_raster(file_path):
+    """Open a raw dump (with --raw) or a large uncompressed TIFF as a MappedRaster, else None."""
+    ext = os.path.splitext(file_path)[1].lower()
+    try:
+        if ext in RAW_EXTENSIONS and raw_format:
+            layout = get_raw_layout(file_path)
+        elif ext in (".tif", ".tiff") and os.path.getsize(file_path) >= MAPPED_MIN_BYTES:
+            layout = read_tiff_layout(file_path)
+        else:
+            return None
+    except OSError:
+        return None
+    return MappedRaster(file_path, layout) if layout else None
+
+def read_image(file_path):
+    """Open an image as a MappedRaster if possible, else decode it with cv2 (None on failure)."""
+    raster = open_mapped_raster(file_path)
+    return raster if raster is not None else cv2.imread(file_path)
+
+def decode_full_worker(file_path, token):
+    """Decode the full-resolution image in the background and hand it to the UI thread."""
+    global decoded_image_pending
+    full = cv2.imread(file_path)
+    decoded_image_pending = (token, full)
+
+def apply_pending_decode():
+    """Swap a finished full-resolution decode in, keeping zoom, pan and measurements (UI thread)."""
+    global decoded_image_pending, image, original_image, image_source_scale, image_width, image_height, needs_redraw
+    if decoded_image_pending is None:
+        return
+    token, full = decoded_image_pending
+    decoded_image_pending = None
+    if token != image_load_token:
+        return  # another image was opened meanwhile
+    if full is None:
+        print(f"Error: failed to decode full image {current_image_path}")
+        return
+    
+    full.flags.writeable = False
+    original_image = image = full
+    image_source_scale = 1
+    image_cache_put(current_image_path, current_image_digest, full)
+    image_width, image_height = full.shape[1], full.shape[0]
+    needs_redraw = True
+    update_display()
+    print(f"Full resolution loaded: {image_width}x{image_height} pixels")
+
+def open_image(file_path):
+    """Open an image file and initialize display, showing a reduced decode first for large JPEGs
+    and memory-mapping large uncompressed rasters."""
+    global image, original_image, zoom_factor, offset_x, offset_y, current_image_path, points, measurements
+    global image_calibration, dragging, image_plane, plane_mode, show_rectified
+    global needs_redraw, current_image_digest, image_width, image_height
+    global image_source_scale, image_load_token
+    
+    # Compact the journal of the previous image before switching
+    if journal_records:
+        save_measurements()
+    
+    load_start = time.perf_counter()
+    image_load_token += 1
+    cached = image_cache_get(file_path)
+    count_event("image_cache_hits" if cached else "image_cache_misses")
+    raster = None if cached else open_mapped_raster(file_path)
+    reduced = None if cached or raster is not None else decode_reduced(file_path)
+    if cached:
+        # Already decoded (prefetched or recently viewed): no decode, no hashing
+        current_image_digest, original_image = cached
+        image = original_image
+        image_width, image_height = image.shape[1], image.shape[0]
+        image_source_scale = 1
+    elif raster is not None:
+        # Nothing is decoded: windows are read from the mapped file as they are shown
+        original_image = image = raster
+        image_width, image_height = raster.width, raster.height
+        image_source_scale = 1
+    elif reduced is not None:
+        image, image_width, image_height, image_source_scale = reduced
+        original_image = None
+        threading.Thread(target=decode_full_worker, args=(file_path, image_load_token),
+                         name="PixelRulerDecode", daemon=True).start()
+    else:
         original_image = cv2.imread(file_path)
         if original_image is None:
-            messagebox.showerror("Error", "Failed to load image.")
+            from tkinter import messagebox
+            run_dialog(messagebox.showerror, "Error", "Failed to load image.")
             return
-        
-        image = original_image.copy()
-        image_display = image.copy()
-        current_image_path = file_path
-        zoom_factor = 1.0
-        offset_x = 0
-        offset_y = 0
-        points = []
-        measurements = []
-        
-        # Reset cache
-        cached_scaled_image = None
-        cached_zoom = 0
-        cached_image_hash = hash(image.tobytes())
-        needs_redraw = True
-        
-        # Load existing measurements if available
-        load_measurements()
-        update_display()
-        print(f"Image loaded: {os.path.basename(file_path)}")
-        print(f"Image size: {image.shape[1]}x{image.shape[0]} pixels")
+        original_image.flags.writeable = False
+        image = original_image
+        image_width, image_height = image.shape[1], image.shape[0]
+        image_source_scale = 1
+    
+    current_image_path = file_path
+    update_viewport_size()
+    zoom_factor = get_fit_zoom()
+    offset_x = 0
+    offset_y = 0
+    points = []
+    measurements = np.zeros(0, dtype=MEASUREMENT_DTYPE)
+    image_calibration = None
+    image_plane = None
+    plane_mode = show_rectified = False
+    plane_points.clear()
+    selected_ids.clear()
+    dragging = None
+    invalidate_geometry()
+    
+    # Tiles and measurement files are keyed by the file's content digest
+    if not cached:
+        current_image_digest = get_image_digest(file_path, raster)
+        if isinstance(original_image, np.ndarray):
+            image_cache_put(file_path, current_image_digest, original_image)
+    needs_redraw = True
+    
+    # Load existing measurements if available
+    load_measurements()
+    if measurement_db is not None:
+        db_sync_image(measurement_db)
+    trace_event("open_image", load_start, args={"path": file_path, "cached": bool(cached),
+                                               "source_scale": image_source_scale})
+    update_display()
+    print(f"Image loaded: {os.path.basename(file_path)}")
+    print(f"Image size: {image_width}x{image_height} pixels")
+    if image_source_scale != 1:
+        print(f"Showing 1/{image_source_scale} resolution while the full image loads...")
+    if raster is not None:
+        print("Memory-mapped: only the visible parts are read from disk")
 
-def to_image_coords(x_screen, y_screen):
-    """Convert screen coordinates to image coordinates."""
-    global zoom_factor, offset_x, offset_y, image
-    if image is None:
+def get_image_cache_key(file_path):
+    """Key decoded images by path, size and modification time, so changed files are re-read."""
+    stat = os.stat(file_path)
+    return os.path.abspath(file_path), stat.st_size, stat.st_mtime_ns
+
+def image_cache_get(file_path):
+    """Get (digest, image) of a decoded image from the cache, or None."""
+    try:
+        key = get_image_cache_key(file_path)
+    except OSError:
+        return None
+    with image_cache_lock:
+        entry = image_cache.get(key)
+        if entry is not None:
+            image_cache.move_to_end(key)
+        return entry
+
+def image_cache_put(file_path, digest, img):
+    """Put a decoded image into the cache and evict the oldest ones over the byte budget."""
+    global image_cache_bytes
+    try:
+        key = get_image_cache_key(file_path)
+    except OSError:
+        return
+    with image_cache_lock:
+        if key in image_cache:
+            image_cache_bytes -= image_cache.pop(key)[1].nbytes
+        image_cache[key] = (digest, img)
+        image_cache_bytes += img.nbytes
+        while image_cache_bytes > image_cache_budget and len(image_cache) > 1:
+            _, (_, evicted) = image_cache.popitem(last=False)
+            image_cache_bytes -= evicted.nbytes
+
+def prebuild_level(img, img_key, level):
+    """Build all tiles of one pyramid level with a single resize (used for prefetching)."""
+    if level == 0:
+        return
+    level_width, level_height = get_level_size(img, level)
+    level_image = cv2.resize(img, (level_width, level_height), interpolation=cv2.INTER_AREA)
+    for ty in range(0, level_height, TILE_SIZE):
+        for tx in range(0, level_width, TILE_SIZE):
+            tile_cache_put((img_key, level, tx // TILE_SIZE, ty // TILE_SIZE),
+                           np.ascontiguousarray(level_image[ty:ty + TILE_SIZE, tx:tx + TILE_SIZE]))
+
+def prefetch_image(file_path):
+    """Decode an image, hash it and pre-build the pyramid level shown at fit zoom."""
+    if image_cache_get(file_path) is not None:
+        return
+    img = read_image(file_path)
+    if not isinstance(img, np.ndarray):
+        return  # failed, or a mapped raster, which opens instantly anyway
+    img.flags.writeable = False
+    digest = get_image_digest(file_path)
+    image_cache_put(file_path, digest, img)
+    
+    width, height = img.shape[1], img.shape[0]
+    # Never query the screen here: Tk must only be touched from the UI thread
+    viewport = compute_viewport_size(width, height, screen_size or DEFAULT_SCREEN_SIZE)
+    fit_zoom = min(1.0, viewport[0] / width, viewport[1] / height)
+    prebuild_level(img, (digest, 1), choose_level(img, fit_zoom))
+
+def prefetch_worker():
+    """Prefetch thread: decodes queued session neighbours one at a time."""
+    while True:
+        with prefetch_condition:
+            while not prefetch_queue:
+                prefetch_condition.wait()
+            file_path = prefetch_queue.pop(0)
+        try:
+            prefetch_image(file_path)
+        except Exception as e:
+            print(f"Prefetch error for {file_path}: {e}")
+
+def schedule_prefetch():
+    """Queue the neighbours of the current session image, nearest first."""
+    global prefetch_thread
+    get_screen_size()  # resolve it on the UI thread for the prefetch worker
+    if prefetch_thread is None:
+        prefetch_thread = threading.Thread(target=prefetch_worker, name="PixelRulerPrefetch", daemon=True)
+        prefetch_thread.start()
+    
+    neighbours = [session_index + 1, session_index - 1, session_index + 2]
+    with prefetch_condition:
+        prefetch_queue[:] = [session_files[i] for i in neighbours if 0 <= i < len(session_files)]
+        prefetch_condition.notify()
+
+def list_session_files(path):
+    """List the images of a session: a folder's images, or the paths listed in a text file."""
+    if os.path.isdir(path):
+        return [os.path.join(path, f) for f in sorted(os.listdir(path))
+                if os.path.splitext(f)[1].lower() in get_image_extensions()]
+    base_dir = os.path.dirname(os.path.abspath(path))
+    with open(path, "r", encoding="utf-8") as f:
+        lines = [line.strip() for line in f]
+    return [os.path.join(base_dir, line) for line in lines if line and not line.startswith("#")]
+
+def open_session(path):
+    """Open a folder or file list as a session and show its first image."""
+    global session_files, session_index
+    files = list_session_files(path)
+    if not files:
+        print(f"No images found in {path}")
+        return
+    session_files = files
+    session_index = 0
+    print(f"Session opened: {len(session_files)} images")
+    open_image(session_files[session_index])
+    schedule_prefetch()
+
+def open_session_dialog():
+    """Ask for a folder and open it as a session."""
+    from tkinter import filedialog
+    directory = run_dialog(filedialog.askdirectory, title="Select folder of images")
+    if directory:
+        open_session(directory)
+
+def step_session(delta):
+    """Switch to the next (+1) or previous (-1) image of the session."""
+    global session_index
+    if not session_files:
+        print("No session open. Press 'o' to open a folder.")
+        return
+    new_index = max(0, min(len(session_files) - 1, session_index + delta))
+    if new_index == session_index:
+        print("No more images in this direction.")
+        return
+    session_index = new_index
+    open_image(session_files[session_index])
+    print(f"Session image {session_index + 1}/{len(session_files)}")
+    schedule_prefetch()
+
+def parse_raw_shape(value):
+    """Parse a WxH or WxHxC raw raster shape for --raw."""
+    try:
+        shape = [int(v) for v in value.lower().split("x")]
+    except ValueError:
+        shape = []
+    if len(shape) == 2:
+        shape.append(3)
+    if len(shape) != 3 or min(shape) <= 0 or shape[2] not in (1, 2, 3, 4):
+        raise argparse.ArgumentTypeError(f"invalid raw shape '{value}', expected WxH or WxHxC (C = 1..4)")
+    return tuple(shape)
+
+def parse_window_size(value):
+    """Parse a WxH viewport size for --window."""
+    try:
+        width, height = (int(v) for v in value.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid window size '{value}', expected WxH")
+    if width <= 0 or height <= 0:
+        raise argparse.ArgumentTypeError(f"invalid window size '{value}', expected WxH")
+    return width, height
+
+def get_screen_size():
+    """Get the screen size (queried once), with a conservative fallback if it cannot be queried."""
+    global screen_size
+    if screen_size is None:
+        try:
+            import tkinter as tk
+        except ImportError:  # headless installs without Tk
+            screen_size = DEFAULT_SCREEN_SIZE
+            return screen_size
+        try:
+            root = get_tk_root()
+            screen_size = root.winfo_screenwidth(), root.winfo_screenheight()
+        except tk.TclError:
+            screen_size = DEFAULT_SCREEN_SIZE
+    return screen_size
+
+def compute_viewport_size(width, height, screen=None):
+    """Get the viewport size for an image: --window, or the image fitted to the (given) screen."""
+    if window_size:
+        return window_size
+    
+    # Leave room for window decorations and the taskbar
+    screen_width, screen_height = screen or get_screen_size()
+    max_width = int(screen_width * 0.9)
+    max_height = int(screen_height * 0.85)
+    scale = min(1.0, max_width / width, max_height / height)
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+def update_viewport_size():
+    """Set the viewport size from --window or by fitting the image to the screen."""
+    global viewport_width, viewport_height
+    viewport_width, viewport_height = compute_viewport_size(image_width, image_height)
+
+def get_fit_zoom():
+    """Get the zoom factor at which the whole image fits into the viewport."""
+    return min(1.0, viewport_width / image_width, viewport_height / image_height)
+
+def ensure_frame_buffer(buffer, width, height):
+    """Clear a frame buffer in place, reallocating it only when the viewport size changed."""
+    if buffer is None or buffer.shape[:2] != (height, width):
+        return np.zeros((height, width, 3), dtype=np.uint8)
+    buffer.fill(0)
+    return buffer
+
+def get_view_state():
+    """Snapshot everything a frame depends on, so it can be rendered off the UI thread."""
+    return {
+        "image": image,
+        "image_key": (current_image_digest, image_source_scale),
+        "image_size": (image_width, image_height),
+        "source_scale": image_source_scale,
+        "zoom": zoom_factor,
+        "offset_x": offset_x,
+        "offset_y": offset_y,
+        "width": viewport_width,
+        "height": viewport_height,
+        "show_measurements": show_measurements,
+        "measurements": measurements.copy(),
+        "calibration_unit": image_calibration["unit"] if image_calibration else "",
+        "plane_unit": image_plane["unit"] if image_plane else "",
+        "plane_preview": image_plane if show_rectified and image_plane else None,
+        "measurements_version": measurements_version,
+        "geometry_version": geometry_version,
+        "selected": frozenset(selected_ids),
+        "requested": time.perf_counter()
+    }
+
+def to_image_coords(x_screen, y_screen, view=None):
+    """Convert screen coordinates to image coordinates (of the current view by default)."""
+    if (image if view is None else view["image"]) is None:
         return 0, 0
-    x_img = (x_screen - offset_x) / zoom_factor
-    y_img = (y_screen - offset_y) / zoom_factor
-    x_img = max(0, min(x_img, image.shape[1]))
-    y_img = max(0, min(y_img, image.shape[0]))
+    width, height = (image_width, image_height) if view is None else view["image_size"]
+    zoom = zoom_factor if view is None else view["zoom"]
+    x_img = (x_screen - (offset_x if view is None else view["offset_x"])) / zoom
+    y_img = (y_screen - (offset_y if view is None else view["offset_y"])) / zoom
+    x_img = max(0, min(x_img, width))
+    y_img = max(0, min(y_img, height))
     return x_img, y_img
 
-def to_screen_coords(x_img, y_img):
-    """Convert image coordinates to screen coordinates."""
-    global zoom_factor, offset_x, offset_y
-    x_screen = x_img * zoom_factor + offset_x
-    y_screen = y_img * zoom_factor + offset_y
+def to_screen_coords(x_img, y_img, view=None):
+    """Convert image coordinates to screen coordinates (of the current view by default)."""
+    zoom = zoom_factor if view is None else view["zoom"]
+    x_screen = x_img * zoom + (offset_x if view is None else view["offset_x"])
+    y_screen = y_img * zoom + (offset_y if view is None else view["offset_y"])
     return x_screen, y_screen
 
 def ask_save_measurement():
     """Ask user if they want to save the measurement."""
-    root = tk.Tk()
-    root.withdraw()
-    result = messagebox.askyesno("Save Measurement", "Do you want to save this measurement?")
-    return result
+    from tkinter import messagebox
+    return run_dialog(messagebox.askyesno, "Save Measurement", "Do you want to save this measurement?")
 
 def select_reference_object():
     """Dialog for selecting a reference object (optional)."""
-    root = tk.Tk()
-    root.withdraw()
+    from tkinter import messagebox, simpledialog
     
     # Ask if user wants to add reference object
-    add_ref = messagebox.askyesno("Reference Object", "Do you want to add a reference object for real-world scaling?")
+    add_ref = run_dialog(messagebox.askyesno, "Reference Object",
+                         "Do you want to add a reference object for real-world scaling?")
     
     if not add_ref:
         return None
@@ -126,7 +861,8 @@ def select_reference_object():
     # Create selection list
     objects = list(REFERENCE_OBJECTS.keys())
     
-    choice = simpledialog.askstring(
+    choice = run_dialog(
+        simpledialog.askstring,
         "Select Reference Object",
         f"Available objects:\n" + "\n".join([f"{i+1}: {obj}" for i, obj in enumerate(objects)]) + 
         f"\n\nEnter number (1-{len(objects)}):"
@@ -139,8 +875,8 @@ def select_reference_object():
             
             if selected_obj == "Custom":
                 # Custom input
-                name = simpledialog.askstring("Custom Object", "Object name:")
-                length = simpledialog.askfloat("Custom Object", "Length (mm):")
+                name = run_dialog(simpledialog.askstring, "Custom Object", "Object name:")
+                length = run_dialog(simpledialog.askfloat, "Custom Object", "Length (mm):")
                 if name and length:
                     return {"name": name, "length": length, "unit": "mm"}
             else:
@@ -150,26 +886,638 @@ def select_reference_object():
     
     return None
 
+def compute_scale_factor(ref_obj, pixel_length):
+    """Derive the scale (unit per pixel) from a reference object measured over pixel_length."""
+    if not ref_obj or pixel_length <= 0:
+        return None
+    if ref_obj.get("length"):
+        return ref_obj["length"] / pixel_length
+    if ref_obj.get("diameter"):
+        return ref_obj["diameter"] / pixel_length
+    return None
+
+def intern_reference(ref_obj):
+    """Get the reference table index of a reference object, adding it if new (-1 for None)."""
+    if not ref_obj:
+        return -1
+    key = json.dumps(ref_obj, sort_keys=True, ensure_ascii=False)
+    if key not in reference_index:
+        reference_index[key] = len(reference_table)
+        reference_table.append(dict(ref_obj))
+    return reference_index[key]
+
+def get_reference(index):
+    """Get the reference object of a reference table index, or None."""
+    return reference_table[index] if index >= 0 else None
+
+def get_reference_unit(index, fallback=""):
+    """Get the unit of a reference table index, or fallback for measurements without one."""
+    return reference_table[index].get("unit", "mm") if index >= 0 else fallback
+
+def measurements_from_dicts(entries):
+    """Build a measurement table from records in the JSON schema."""
+    table = np.zeros(len(entries), dtype=MEASUREMENT_DTYPE)
+    if not entries:
+        return table
+    table["id"] = [m["id"] for m in entries]
+    table["x0"] = [m["start"]["x"] for m in entries]
+    table["y0"] = [m["start"]["y"] for m in entries]
+    table["x1"] = [m["end"]["x"] for m in entries]
+    table["y1"] = [m["end"]["y"] for m in entries]
+    table["pixel_length"] = [m.get("pixel_length") or 0.0 for m in entries]
+    table["real_world_length"] = [np.nan if m.get("real_world_length") is None else m["real_world_length"] for m in entries]
+    table["scale_factor"] = [np.nan if m.get("scale_factor") is None else m["scale_factor"] for m in entries]
+    table["reference"] = [intern_reference(m.get("reference_object")) for m in entries]
+    table["timestamp"] = [m.get("timestamp") or "" for m in entries]
+    table["auto_detected"] = [bool(m.get("auto_detected")) for m in entries]
+    table["rectified_length"] = [np.nan if m.get("rectified_length") is None else m["rectified_length"] for m in entries]
+    return table
+
+def measurements_to_dicts(table):
+    """Convert a measurement table back into records in the JSON schema."""
+    def optional(values):
+        return [None if np.isnan(v) else v for v in values]
+    
+    columns = zip(table["id"].tolist(), table["x0"].tolist(), table["y0"].tolist(),
+                  table["x1"].tolist(), table["y1"].tolist(), table["pixel_length"].tolist(),
+                  table["timestamp"].tolist(), table["reference"].tolist(),
+                  optional(table["real_world_length"].tolist()), optional(table["scale_factor"].tolist()),
+                  table["auto_detected"].tolist(), optional(table["rectified_length"].tolist()))
+    entries = []
+    for (measurement_id, x0, y0, x1, y1, pixel_length, timestamp, reference,
+         real_world_length, scale_factor, auto_detected, rectified_length) in columns:
+        entry = {
+            "id": measurement_id,
+            "start": {"x": x0, "y": y0},
+            "end": {"x": x1, "y": y1},
+            "pixel_length": pixel_length,
+            "timestamp": timestamp,
+            "reference_object": get_reference(reference),
+            "real_world_length": real_world_length,
+            "scale_factor": scale_factor
+        }
+        # Only written for detector proposals, so manual measurements keep the original schema
+        if auto_detected:
+            entry["auto_detected"] = True
+        if rectified_length is not None:
+            entry["rectified_length"] = rectified_length
+        entries.append(entry)
+    return entries
+
+def get_reference_lengths():
+    """Get the known length (or diameter) of every reference table entry, NaN if it has none."""
+    return np.array([ref.get("length") or ref.get("diameter") or np.nan for ref in reference_table] + [np.nan],
+                    dtype=np.float64)
+
+def recompute_measurements(table):
+    """Recompute pixel lengths, scale factors and real-world lengths of all measurements in one pass."""
+    table["pixel_length"] = np.hypot(table["x1"] - table["x0"], table["y1"] - table["y0"])
+    
+    # Index -1 picks the trailing NaN, i.e. no reference object
+    reference_lengths = get_reference_lengths()[table["reference"]]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        scale_factor = np.where(table["pixel_length"] > 0, reference_lengths / table["pixel_length"], np.nan)
+    table["scale_factor"] = scale_factor
+    table["real_world_length"] = table["pixel_length"] * scale_factor
+    return table
+
+def get_reference_dimensions():
+    """Get the known length, width and diameter of every reference table entry, NaN where missing."""
+    dimensions = [[ref.get(key) or np.nan for key in ("length", "width", "diameter")] for ref in reference_table]
+    return np.array(dimensions + [[np.nan] * 3], dtype=np.float64).reshape(-1, 3)
+
+def fit_image_scale(table):
+    """Fit one image scale (unit per pixel) to all reference measurements of a table.
+
+    Every reference line is matched to the known dimension of its object (length, width
+    or diameter) closest to the current estimate, then a least-squares fit on relative
+    errors is iterated with median-absolute-deviation outlier rejection. Returns None if
+    the table has no usable reference measurements.
+    """
+    rows = np.flatnonzero((table["reference"] >= 0) & (table["pixel_length"] > 0))
+    if not len(rows):
+        return None
+    
+    # Only lines in the dominant unit take part in the fit
+    units = np.array([get_reference_unit(index) for index in table["reference"][rows].tolist()])
+    values, counts = np.unique(units, return_counts=True)
+    unit = str(values[np.argmax(counts)])
+    rows = rows[units == unit]
+    dimensions = get_reference_dimensions()[table["reference"][rows]]
+    rows, dimensions = rows[~np.isnan(dimensions).all(axis=1)], dimensions[~np.isnan(dimensions).all(axis=1)]
+    if not len(rows):
+        return None
+    pixel_length = table["pixel_length"][rows]
+    
+    # Start from the median scale of each object's primary dimension (length or diameter)
+    primary = np.where(np.isnan(dimensions[:, 0]), dimensions[:, 2], dimensions[:, 0])
+    primary = np.where(np.isnan(primary), dimensions[:, 1], primary)
+    scale = float(np.median(primary / pixel_length))
+    inliers = np.ones(len(rows), dtype=bool)
+    for _ in range(CALIBRATION_MAX_ITERATIONS):
+        log_error = np.abs(np.log(dimensions / (scale * pixel_length[:, None])))
+        known = dimensions[np.arange(len(rows)), np.argmin(np.where(np.isnan(log_error), np.inf, log_error), axis=1)]
+        residual = (scale * pixel_length - known) / known
+        
+        deviation = np.abs(residual - np.median(residual[inliers]))
+        spread = max(1.4826 * np.median(deviation[inliers]), CALIBRATION_MIN_SPREAD)
+        new_inliers = deviation <= CALIBRATION_OUTLIER_MADS * spread
+        if not new_inliers.any():
+            new_inliers = inliers
+        
+        # Minimises sum(((scale * pixel_length - known) / known) ** 2) over the inliers
+        ratio = pixel_length[new_inliers] / known[new_inliers]
+        new_scale = float(ratio.sum() / (ratio ** 2).sum())
+        converged = np.array_equal(new_inliers, inliers) and np.isclose(new_scale, scale, rtol=1e-9)
+        scale, inliers = new_scale, new_inliers
+        if converged:
+            break
+    
+    # Standard error of the scale from the spread of the inlier residuals
+    residual = (scale * pixel_length[inliers] - known[inliers]) / known[inliers]
+    count = int(inliers.sum())
+    uncertainty = scale * float(np.sqrt((residual ** 2).sum() / (count - 1) / count)) if count > 1 else None
+    return {
+        "scale": scale,
+        "uncertainty": uncertainty,
+        "unit": unit,
+        "references": count,
+        "rejected": table["id"][rows[~inliers]].tolist()
+    }
+
+def apply_image_scale(table, calibration):
+    """Re-derive scale factor and real-world length of every measurement from an image calibration."""
+    table["scale_factor"] = calibration["scale"]
+    table["real_world_length"] = table["pixel_length"] * calibration["scale"]
+    return table
+
+def get_plane_homography(plane):
+    """Get the homography of a plane calibration as a 3x3 array."""
+    return np.array(plane["homography"], dtype=np.float64)
+
+def rectify_measurements(table, plane):
+    """Compute plane-rectified lengths of all measurements in one pass over their endpoints."""
+    if plane is None or not len(table):
+        table["rectified_length"] = np.nan
+        return table
+    homography = get_plane_homography(plane)
+    endpoints = np.column_stack([table["x0"], table["y0"], table["x1"], table["y1"]]).reshape(-1, 1, 2)
+    mapped = cv2.perspectiveTransform(endpoints, homography).reshape(-1, 4)
+    lengths = np.hypot(mapped[:, 2] - mapped[:, 0], mapped[:, 3] - mapped[:, 1])
+    
+    # Endpoints beyond the plane's horizon have no rectified position
+    depth = homography[2, 0] * endpoints[:, 0, 0] + homography[2, 1] * endpoints[:, 0, 1] + homography[2, 2]
+    beyond = (depth <= 0).reshape(-1, 2).any(axis=1)
+    table["rectified_length"] = np.where(beyond, np.nan, lengths)
+    return table
+
+def compute_plane(corners, ref_obj):
+    """Compute a plane calibration from four image corners of a rectangular reference object."""
+    corners = np.float64(corners)
+    sides = np.hypot(*(np.roll(corners, -1, axis=0) - corners).T)
+    
+    # The clicked edge pair that is longer in the image gets the object's length
+    length, width = ref_obj["length"], ref_obj["width"]
+    size = (length, width) if sides[0] + sides[2] >= sides[1] + sides[3] else (width, length)
+    target = np.float64([[0, 0], [size[0], 0], [size[0], size[1]], [0, size[1]]])
+    homography = cv2.getPerspectiveTransform(np.float32(corners), np.float32(target)).astype(np.float64)
+    
+    # Keep the projective depth of the reference positive, so "beyond the horizon" is depth <= 0
+    if homography[2] @ np.append(corners.mean(axis=0), 1) < 0:
+        homography = -homography
+    return {
+        "homography": homography.tolist(),
+        "corners": corners.tolist(),
+        "size": list(size),
+        "unit": ref_obj.get("unit", "mm"),
+        "reference_object": ref_obj
+    }
+
+def format_calibration(calibration):
+    """Describe an image calibration in one line."""
+    uncertainty = calibration.get("uncertainty")
+    spread = f" ± {uncertainty:.4f}" if uncertainty is not None else ""
+    text = (f"1 px = {calibration['scale']:.4f}{spread} {calibration['unit']} "
+            f"({calibration['references']} references")
+    if calibration["rejected"]:
+        text += f", rejected: {', '.join(f'#{i}' for i in calibration['rejected'])}"
+    return text + ")"
+
+def get_snap_roi(x0, y0, x1, y1):
+    """Get grey values, gradients and corner response of a ROI of the current image (cached)."""
+    key = (current_image_digest, image_source_scale, x0, y0, x1, y1)
+    if key in snap_cache:
+        snap_cache.move_to_end(key)
+        return snap_cache[key]
+    
+    roi = image[y0:y1, x0:x1]
+    gray = cv2.cvtColor(roi, cv2.COLOR_BGR2GRAY) if roi.ndim == 3 else np.ascontiguousarray(roi)
+    gray = gray.astype(np.float32)
+    # Scharr scaled to grey levels per pixel
+    gx = cv2.Scharr(gray, cv2.CV_32F, 1, 0, scale=1 / 32)
+    gy = cv2.Scharr(gray, cv2.CV_32F, 0, 1, scale=1 / 32)
+    entry = (gray, gx, gy, cv2.magnitude(gx, gy), cv2.cornerMinEigenVal(gray / 255, 5, 3))
+    snap_cache[key] = entry
+    if len(snap_cache) > SNAP_CACHE_SIZE:
+        snap_cache.popitem(last=False)
+    return entry
+
+def snap_point(x_img, y_img, radius, corners=True, strict=False):
+    """Refine an image point to the nearest strong corner (if corners) or edge within radius (sub-pixel).
+
+    Corners are refined with cv2.cornerSubPix; edges by a parabola fit of the gradient
+    magnitude across the edge. Returns the point unchanged (None if strict) if nothing
+    strong is near.
+    """
+    missing = None if strict else (x_img, y_img)
+    height, width = image.shape[:2]
+    center_x, center_y = x_img / image_source_scale, y_img / image_source_scale
+    radius = max(2.0, min(radius, SNAP_MAX_RADIUS) / image_source_scale)
+    
+    # Grid-aligned ROI with room for the refinement windows, so nearby clicks share it
+    pad = int(radius) + 8
+    x0 = max(0, int(center_x - pad) // SNAP_ROI_ALIGN * SNAP_ROI_ALIGN)
+    y0 = max(0, int(center_y - pad) // SNAP_ROI_ALIGN * SNAP_ROI_ALIGN)
+    x1 = min(width, -(-int(center_x + pad + 1) // SNAP_ROI_ALIGN) * SNAP_ROI_ALIGN)
+    y1 = min(height, -(-int(center_y + pad + 1) // SNAP_ROI_ALIGN) * SNAP_ROI_ALIGN)
+    if x1 - x0 < 8 or y1 - y0 < 8:
+        return missing
+    gray, gx, gy, magnitude, corner_response = get_snap_roi(x0, y0, x1, y1)
+    
+    # Candidate pixels within radius of the click, in ROI coordinates
+    local_x, local_y = center_x - x0, center_y - y0
+    grid_y, grid_x = np.mgrid[0:y1 - y0, 0:x1 - x0]
+    distance = np.hypot(grid_x - local_x, grid_y - local_y)
+    inside = (distance <= radius) & (grid_x >= 3) & (grid_y >= 3) & (grid_x < x1 - x0 - 3) & (grid_y < y1 - y0 - 3)
+    if not inside.any():
+        return missing
+    
+    # Corner: strongest response within radius, refined with cornerSubPix
+    response = np.where(inside, corner_response, 0)
+    best = np.unravel_index(np.argmax(response), response.shape)
+    if corners and response[best] >= SNAP_MIN_CORNER:
+        corner = np.array([[[best[1], best[0]]]], dtype=np.float32)
+        criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 20, 0.01)
+        cv2.cornerSubPix(gray, corner, (3, 3), (-1, -1), criteria)
+        snapped_x, snapped_y = float(corner[0, 0, 0]), float(corner[0, 0, 1])
+        if np.hypot(snapped_x - local_x, snapped_y - local_y) <= radius + 1:
+            return (snapped_x + x0) * image_source_scale, (snapped_y + y0) * image_source_scale
+    
+    # Edge: nearest pixel with a strong gradient, i.e. close to the strongest one nearby
+    strength = np.where(inside, magnitude, 0)
+    threshold = max(SNAP_MIN_EDGE, 0.5 * float(strength.max()))
+    strong = strength >= threshold
+    if not strong.any():
+        return missing
+    best = np.unravel_index(np.argmin(np.where(strong, distance, np.inf)), distance.shape)
+    
+    # Climb to the local maximum across the edge, then fit a parabola to it
+    normal_x, normal_y = gx[best] / magnitude[best], gy[best] / magnitude[best]
+    def sample_across(px, py):
+        return [float(cv2.getRectSubPix(magnitude, (1, 1), (px + k * normal_x, py + k * normal_y))[0, 0])
+                for k in (-1, 0, 1)]
+    
+    px, py = float(best[1]), float(best[0])
+    behind, here, ahead = sample_across(px, py)
+    for _ in range(3):
+        if ahead > here and ahead >= behind:
+            px, py = px + normal_x, py + normal_y
+        elif behind > here:
+            px, py = px - normal_x, py - normal_y
+        else:
+            break
+        behind, here, ahead = sample_across(px, py)
+    curvature = ahead - 2 * here + behind
+    offset = 0.5 * (behind - ahead) / curvature if curvature < 0 else 0.0
+    offset = float(np.clip(offset, -1, 1))
+    return (float(px + offset * normal_x + x0) * image_source_scale,
+            float(py + offset * normal_y + y0) * image_source_scale)
+
+def add_measurement(start, end, ref_obj, auto_detected=False):
+    """Add a measurement between two image points, scaled by its reference object or the calibration."""
+    global measurements
+    pixel_length = np.sqrt((end[0] - start[0])**2 + (end[1] - start[1])**2)
+    measurement = {
+        "id": int(measurements["id"].max()) + 1 if len(measurements) else 1,
+        "start": {"x": float(start[0]), "y": float(start[1])},
+        "end": {"x": float(end[0]), "y": float(end[1])},
+        "pixel_length": float(pixel_length),
+        "timestamp": datetime.now().isoformat(),
+        "reference_object": ref_obj,
+        "real_world_length": None,
+        "scale_factor": None
+    }
+    if auto_detected:
+        measurement["auto_detected"] = True
+    
+    # Calculate real length if reference object was selected
+    scale_factor = compute_scale_factor(ref_obj, pixel_length)
+    if not ref_obj and image_calibration:
+        scale_factor = image_calibration["scale"]
+    if scale_factor:
+        measurement["scale_factor"] = float(scale_factor)
+        measurement["real_world_length"] = float(pixel_length * scale_factor)
+    unit = ref_obj.get("unit", "mm") if ref_obj else image_calibration["unit"] if image_calibration else ""
+    row = rectify_measurements(measurements_from_dicts([measurement]), image_plane)
+    if image_plane and row["rectified_length"][0] > 0:
+        measurement["rectified_length"] = float(row["rectified_length"][0])
+    
+    measurements = np.concatenate([measurements, row])
+    invalidate_geometry([len(measurements) - 1])
+    
+    print(f"\nMeasurement #{measurement['id']} created{' (auto-detected)' if auto_detected else ''}:")
+    print(f"  Pixels: {pixel_length:.2f} px")
+    if measurement["real_world_length"]:
+        print(f"  Real: {measurement['real_world_length']:.2f} {unit}")
+        print(f"  Scale: 1 px = {measurement['scale_factor']:.4f} {unit}")
+    if measurement.get("rectified_length"):
+        print(f"  On plane: {measurement['rectified_length']:.2f} {image_plane['unit']}")
+    if ref_obj:
+        print(f"  Reference: {ref_obj['name']}")
+    else:
+        print(f"  Reference: None (pixel measurement only)")
+    
+    journal_append({"op": "add", "measurement": measurement})
+    return measurement
+
+def fit_circle(points_xy):
+    """Least-squares (Kasa) circle fit; returns centre x, centre y, radius and relative residual."""
+    x, y = points_xy[:, 0], points_xy[:, 1]
+    design = np.column_stack([x, y, np.ones(len(x))])
+    (a, b, c), *_ = np.linalg.lstsq(design, x * x + y * y, rcond=None)
+    center_x, center_y = a / 2, b / 2
+    radius = np.sqrt(max(c + center_x ** 2 + center_y ** 2, 1e-12))
+    residual = np.std(np.hypot(x - center_x, y - center_y) - radius) / radius
+    return center_x, center_y, radius, residual
+
+def fit_circle_robust(points_xy, min_inliers):
+    """Circle fit that ignores outline samples snapped to other edges; None if too few agree.
+
+    Every triple of samples proposes a circle (exhaustive RANSAC, the sample count is
+    small); the least-squares fit is repeated on the samples of the best-supported one.
+    """
+    triples = np.array(list(itertools.combinations(range(len(points_xy)), 3)))
+    if not len(triples):
+        return None
+    p, q, r = (points_xy[triples[:, i]] for i in range(3))
+    # Circumcentres of all triples at once
+    b, c = q - p, r - p
+    determinant = 2 * (b[:, 0] * c[:, 1] - b[:, 1] * c[:, 0])
+    valid = np.abs(determinant) > 1e-9
+    b, c, p, determinant = b[valid], c[valid], p[valid], determinant[valid]
+    if not len(p):
+        return None
+    b_squared, c_squared = (b ** 2).sum(axis=1), (c ** 2).sum(axis=1)
+    center_x = p[:, 0] + (c[:, 1] * b_squared - b[:, 1] * c_squared) / determinant
+    center_y = p[:, 1] + (b[:, 0] * c_squared - c[:, 0] * b_squared) / determinant
+    radius = np.hypot(center_x - p[:, 0], center_y - p[:, 1])
+    
+    distance = np.abs(np.hypot(points_xy[:, 0] - center_x[:, None], points_xy[:, 1] - center_y[:, None]) - radius[:, None])
+    inliers = distance <= np.maximum(1.5, DETECT_INLIER_TOLERANCE * radius)[:, None]
+    best = inliers[np.argmax(inliers.sum(axis=1))]
+    if best.sum() < min_inliers:
+        return None
+    return fit_circle(points_xy[best])
+
+def refine_rectangle(box, scale, radius):
+    """Refine a coarse rectangle (4 corners, full-resolution image coordinates) at full resolution.
+
+    Points along the middle of each side are snapped to the edge, a line is fitted per
+    side, and adjacent lines are intersected, which also works for rounded corners.
+    Returns the refined corners and the relative fit residual, or None.
+    """
+    lines = []
+    residual = 0.0
+    for i in range(4):
+        p, q = box[i], box[(i + 1) % 4]
+        samples = [p + (q - p) * t for t in np.linspace(0.2, 0.8, DETECT_OUTLINE_SAMPLES)]
+        snapped = [snap_point(x, y, radius, corners=False, strict=True) for x, y in samples]
+        snapped = np.float32([point for point in snapped if point is not None])
+        if len(snapped) < DETECT_OUTLINE_SAMPLES // 2:
+            return None
+        vx, vy, x0, y0 = cv2.fitLine(snapped, cv2.DIST_HUBER, 0, 0.01, 0.01).ravel()
+        distance = np.abs((snapped[:, 0] - x0) * vy - (snapped[:, 1] - y0) * vx)
+        residual = max(residual, float(np.std(distance)) / max(np.hypot(*(q - p)), 1.0))
+        lines.append((x0, y0, vx, vy))
+    
+    corners = []
+    for (x1, y1, vx1, vy1), (x2, y2, vx2, vy2) in zip(lines[-1:] + lines[:-1], lines):
+        determinant = vx1 * vy2 - vy1 * vx2
+        if abs(determinant) < 1e-6:
+            return None
+        t = ((x2 - x1) * vy2 - (y2 - y1) * vx2) / determinant
+        corners.append((x1 + t * vx1, y1 + t * vy1))
+    return np.float64(corners), residual
+
+def detect_reference_objects():
+    """Propose reference objects in the current image: cards/phones by aspect ratio, coins as circles.
+
+    The search runs on a downscaled copy; only small ROIs along each candidate outline
+    are read at full resolution (via snap_point). Returns (name, start, end, score)
+    tuples, best first.
+    """
+    height, width = image.shape[:2]
+    scale = max(1.0, max(width, height) / DETECT_MAX_SIDE)
+    small_size = (max(1, int(width / scale)), max(1, int(height / scale)))
+    if isinstance(image, MappedRaster):
+        # Start from the finest pyramid level that is at most 2x the search size, not the whole file
+        level = max(0, int(np.ceil(np.log2(scale))) - 1)
+        level_width, level_height = get_level_size(image, level)
+        image_key = (current_image_digest, image_source_scale)
+        small = cv2.resize(get_level_region(image, image_key, level, 0, 0, level_width, level_height),
+                           small_size, interpolation=cv2.INTER_AREA)
+    else:
+        small = cv2.resize(image, small_size, interpolation=cv2.INTER_AREA)
+    small = cv2.GaussianBlur(small, (5, 5), 0)
+    
+    # Edges of every colour channel, so objects that differ mostly in hue are found too
+    edges = np.zeros(small.shape[:2], dtype=np.uint8)
+    for channel in (cv2.split(small) if small.ndim == 3 else [small]):
+        edges |= cv2.Canny(channel, DETECT_CANNY_LOW, DETECT_CANNY_HIGH)
+    edges = cv2.dilate(edges, np.ones((3, 3), np.uint8))
+    min_side = 12
+    candidates = []
+    
+    rectangles = [(name, ref["length"] / ref["width"]) for name, ref in REFERENCE_OBJECTS.items()
+                  if ref.get("length") and ref.get("width")]
+    coins = [name for name, ref in REFERENCE_OBJECTS.items() if ref.get("diameter")]
+    contours, _ = cv2.findContours(edges, cv2.RETR_LIST, cv2.CHAIN_APPROX_NONE)
+    for contour in contours:
+        (center_x, center_y), (box_width, box_height), _ = cv2.minAreaRect(contour)
+        if min(box_width, box_height) < min_side:
+            continue
+        aspect = max(box_width, box_height) / min(box_width, box_height)
+        fill = cv2.contourArea(cv2.convexHull(contour)) / (box_width * box_height)
+        
+        # Rectangles whose aspect ratio matches a reference object with length and width
+        if fill >= 0.9:
+            name, ratio = min(rectangles, key=lambda item: abs(aspect / item[1] - 1))
+            error = abs(aspect / ratio - 1)
+            if error <= DETECT_ASPECT_TOLERANCE:
+                box = cv2.boxPoints(cv2.minAreaRect(contour)).astype(np.float64) * scale
+                candidates.append(("rectangle", name, box, 1 - error / DETECT_ASPECT_TOLERANCE,
+                                   (center_x * scale, center_y * scale, max(box_width, box_height) * scale)))
+        
+        # Circles for reference objects with a diameter: every outline point near one radius
+        elif coins and aspect <= 1.15:
+            (circle_x, circle_y), radius = cv2.minEnclosingCircle(contour)
+            distance = np.hypot(*(contour[:, 0, :] - (circle_x, circle_y)).T)
+            roundness = float(np.std(distance)) / radius
+            if roundness <= DETECT_MAX_ROUNDNESS and distance.mean() >= 0.9 * radius:
+                # Start from the mean outline radius: the enclosing circle overshoots it
+                candidates.append(("circle", coins[0], (circle_x * scale, circle_y * scale, distance.mean() * scale,
+                                                        float(np.std(distance)) * scale),
+                                   1 - roundness / DETECT_MAX_ROUNDNESS,
+                                   (circle_x * scale, circle_y * scale, 2 * radius * scale)))
+    
+    # Refine at full resolution, best candidates first, skipping duplicates of accepted ones
+    proposals = []
+    accepted = []
+    for kind, name, shape, score, (center_x, center_y, size) in sorted(candidates, key=lambda c: -c[3]):
+        if len(proposals) >= DETECT_MAX_PROPOSALS:
+            break
+        if any(np.hypot(center_x - x, center_y - y) < 0.5 * max(size, other) for x, y, other in accepted):
+            continue
+        if kind == "rectangle":
+            refined = refine_rectangle(shape, scale, DETECT_COARSE_ERROR * scale + 2)
+            if refined is None or refined[1] > DETECT_MAX_RESIDUAL:
+                continue
+            corners, residual = refined
+            # Measure along a long side, corner to corner
+            long_side = 0 if np.hypot(*(corners[1] - corners[0])) >= np.hypot(*(corners[2] - corners[1])) else 1
+            start, end = corners[long_side], corners[long_side + 1]
+        else:
+            circle_x, circle_y, radius, spread = shape
+            # Samples that find no edge near the outline are dropped, those that snapped
+            # to another edge are rejected by the robust fit
+            angles = np.linspace(0, 2 * np.pi, 2 * DETECT_OUTLINE_SAMPLES, endpoint=False)
+            snapped = [snap_point(circle_x + radius * np.cos(a), circle_y + radius * np.sin(a),
+                                  spread + DETECT_COARSE_ERROR * scale + 2, corners=False, strict=True)
+                       for a in angles]
+            fitted = fit_circle_robust(np.float64([point for point in snapped if point is not None]),
+                                       DETECT_OUTLINE_SAMPLES)
+            if fitted is None or fitted[3] > DETECT_MAX_RESIDUAL:
+                continue
+            circle_x, circle_y, radius, residual = fitted
+            # Measure the horizontal diameter
+            start, end = (circle_x - radius, circle_y), (circle_x + radius, circle_y)
+        accepted.append((center_x, center_y, size))
+        proposals.append((name, (float(start[0]), float(start[1])), (float(end[0]), float(end[1])),
+                          score * (1 - residual / DETECT_MAX_RESIDUAL)))
+    return proposals
+
+def auto_detect_references():
+    """Detect reference objects and add them as pre-filled measurements."""
+    global needs_redraw
+    if image is None:
+        return
+    if image_source_scale != 1:
+        print("Full-resolution image is still loading, please try again in a moment.")
+        return
+    
+    start_time = time.perf_counter()
+    proposals = detect_reference_objects()
+    for name, start, end, _ in proposals:
+        ref_obj = REFERENCE_OBJECTS[name].copy()
+        ref_obj["name"] = name
+        add_measurement(start, end, ref_obj, auto_detected=True)
+    needs_redraw = True
+    update_display()
+    if proposals:
+        refresh_calibration()
+    print(f"Auto-detect: {len(proposals)} reference objects proposed in {time.perf_counter() - start_time:.2f}s")
+    if proposals:
+        print("Check the proposals, delete wrong ones (Shift + click, 'x') and press 'c' to calibrate.")
+
+def get_click_point(x, y):
+    """Get the image point of a click, snapped to an edge or corner if snapping is on."""
+    img_x, img_y = to_image_coords(x, y)
+    if snap_enabled:
+        img_x, img_y = snap_point(img_x, img_y, SNAP_RADIUS / zoom_factor)
+    return img_x, img_y
+
+def toggle_snap():
+    """Toggle snapping of measurement points to edges and corners."""
+    global snap_enabled
+    snap_enabled = not snap_enabled
+    print(f"Edge snapping {'on' if snap_enabled else 'off'}")
+
 def mouse_callback(event, x, y, flags, param):
     """Handle mouse events for points, panning and zooming."""
     global points, image_display, panning, last_mouse_x, last_mouse_y, offset_x, offset_y, zoom_factor, current_mouse_x, current_mouse_y
-    global needs_redraw
+    global needs_redraw, dragging
     
     if image is None:
         return
         
     current_mouse_x, current_mouse_y = x, y
+    mark_activity()
     
-    if event == cv2.EVENT_LBUTTONDOWN and not (flags & cv2.EVENT_FLAG_CTRLKEY):
-        # Set point in image coordinates
+    if event == cv2.EVENT_LBUTTONDOWN and show_rectified and not (flags & cv2.EVENT_FLAG_CTRLKEY):
+        print("Rectified preview is shown; press 'v' to return to the image for measuring.")
+    
+    elif event == cv2.EVENT_LBUTTONDOWN and plane_mode and not (flags & cv2.EVENT_FLAG_CTRLKEY):
+        add_plane_point(get_click_point(x, y))
+    
+    elif event == cv2.EVENT_LBUTTONDOWN and (flags & cv2.EVENT_FLAG_SHIFTKEY) and not (flags & cv2.EVENT_FLAG_CTRLKEY):
+        # Shift + click: grab an endpoint, or toggle the selection of the line under the cursor
+        img_x, img_y = to_image_coords(x, y)
+        hit = hit_test(img_x, img_y, HIT_RADIUS / zoom_factor)
+        if hit is None:
+            selected_ids.clear()
+        else:
+            measurement_id = int(measurements["id"][hit[0]])
+            if hit[1]:
+                dragging = (measurement_id, hit[1])
+            elif measurement_id in selected_ids:
+                selected_ids.discard(measurement_id)
+            else:
+                selected_ids.add(measurement_id)
+        invalidate_overlay()
+        request_redraw()
+    
+    elif event == cv2.EVENT_MOUSEMOVE and dragging:
         img_x, img_y = to_image_coords(x, y)
+        rows = np.flatnonzero(measurements["id"] == dragging[0])
+        if len(rows):
+            x_field, y_field = ("x0", "y0") if dragging[1] == "start" else ("x1", "y1")
+            measurements[x_field][rows] = img_x
+            measurements[y_field][rows] = img_y
+            recompute_rows(rows)
+            invalidate_geometry(rows)
+            request_redraw()
+    
+    elif event == cv2.EVENT_LBUTTONUP and dragging:
+        rows = np.flatnonzero(measurements["id"] == dragging[0])
+        if len(rows) and snap_enabled:
+            x_field, y_field = ("x0", "y0") if dragging[1] == "start" else ("x1", "y1")
+            measurements[x_field][rows], measurements[y_field][rows] = get_click_point(x, y)
+            recompute_rows(rows)
+            invalidate_geometry(rows)
+            needs_redraw = True
+        dragging = None
+        if len(rows):
+            measurement = measurements_to_dicts(measurements[rows])[0]
+            journal_append({"op": "update", "measurement": measurement})
+            print(f"Measurement #{measurement['id']} edited: {measurement['pixel_length']:.2f} px")
+        update_display()
+        if len(rows) and measurements["reference"][rows[0]] >= 0:
+            refresh_calibration()
+    
+    elif event == cv2.EVENT_LBUTTONDOWN and not (flags & cv2.EVENT_FLAG_CTRLKEY):
+        # Set point in image coordinates
+        img_x, img_y = get_click_point(x, y)
         points.append((img_x, img_y))
         
+        if len(points) % 2 == 1:
+            # First point: only the rubber-band line starts following the cursor
+            mark_cursor_dirty()
+            return
+        
         if len(points) % 2 == 0:
             # Two points -> create measurement
             start = points[-2]
             end = points[-1]
-            pixel_length = np.sqrt((end[0] - start[0])**2 + (end[1] - start[1])**2)
             
             # Ask if user wants to save this measurement
             if not ask_save_measurement():
@@ -182,268 +1530,1228 @@ def mouse_callback(event, x, y, flags, param):
             
             # Ask for reference object (optional)
             ref_obj = select_reference_object()
-            
-            measurement = {
-                "id": len(measurements) + 1,
-                "start": {"x": float(start[0]), "y": float(start[1])},
-                "end": {"x": float(end[0]), "y": float(end[1])},
-                "pixel_length": float(pixel_length),
-                "timestamp": datetime.now().isoformat(),
-                "reference_object": ref_obj,
-                "real_world_length": None,
-                "scale_factor": None
-            }
-            
-            # Calculate real length if reference object was selected
+            add_measurement(start, end, ref_obj)
             if ref_obj:
-                if "length" in ref_obj:
-                    scale_factor = ref_obj["length"] / pixel_length
-                elif "diameter" in ref_obj:
-                    scale_factor = ref_obj["diameter"] / pixel_length
-                else:
-                    scale_factor = None
-                
-                if scale_factor:
-                    measurement["scale_factor"] = float(scale_factor)
-                    measurement["real_world_length"] = float(pixel_length * scale_factor)
-            
-            measurements.append(measurement)
-            
-            print(f"\nMeasurement #{measurement['id']} created:")
-            print(f"  Pixels: {pixel_length:.2f} px")
-            if measurement["real_world_length"]:
-                print(f"  Real: {measurement['real_world_length']:.2f} {ref_obj.get('unit', 'mm')}")
-                print(f"  Scale: 1 px = {measurement['scale_factor']:.4f} {ref_obj.get('unit', 'mm')}")
-            if ref_obj:
-                print(f"  Reference: {ref_obj['name']}")
-            else:
-                print(f"  Reference: None (pixel measurement only)")
-            
-            save_measurements()
+                refresh_calibration()
         
         needs_redraw = True
         update_display()
     
-    elif event == cv2.EVENT_LBUTTONDOWN and (flags & cv2.EVENT_FLAG_CTRLKEY):
-        panning = True
-        last_mouse_x = x
-        last_mouse_y = y
+    elif event == cv2.EVENT_LBUTTONDOWN and (flags & cv2.EVENT_FLAG_CTRLKEY):
+        panning = True
+        last_mouse_x = x
+        last_mouse_y = y
+    
+    elif event == cv2.EVENT_MOUSEMOVE and panning and (flags & cv2.EVENT_FLAG_CTRLKEY):
+        # Optimierung: Nur bei größeren Bewegungen neu zeichnen
+        dx = x - last_mouse_x
+        dy = y - last_mouse_y
+        
+        if abs(dx) > 2 or abs(dy) > 2:  # Mindestbewegung für Update
+            last_mouse_x = x
+            last_mouse_y = y
+            offset_x += dx
+            offset_y += dy
+            request_redraw()
+    
+    elif event == cv2.EVENT_MOUSEMOVE and not panning:
+        # Only the cursor layer changes: no re-render of the image or the overlay
+        if has_cursor_layer() or cursor_patches:
+            mark_cursor_dirty()
+    
+    elif event == cv2.EVENT_LBUTTONUP:
+        panning = False
+        if needs_redraw:
+            update_display()
+    
+    elif event == cv2.EVENT_MOUSEWHEEL and (flags & cv2.EVENT_FLAG_CTRLKEY):
+        old_zoom_factor = zoom_factor
+        if flags > 0:
+            zoom_factor *= 1.1
+        else:
+            zoom_factor /= 1.1
+        zoom_factor = max(min(min_zoom, get_fit_zoom()), min(zoom_factor, max_zoom))
+        
+        factor = zoom_factor / old_zoom_factor
+        offset_x = current_mouse_x - (current_mouse_x - offset_x) * factor
+        offset_y = current_mouse_y - (current_mouse_y - offset_y) * factor
+        request_redraw()
+
+def mark_activity():
+    """Record user input so the main loop stays responsive."""
+    global last_activity_time
+    last_activity_time = time.monotonic()
+
+def get_frame_interval():
+    """Get the minimum time between two frames in seconds."""
+    return 1.0 / max(1, fps_cap)
+
+def request_redraw():
+    """Request a redraw; the render thread coalesces requests to the latest view."""
+    global needs_redraw
+    needs_redraw = True
+    if is_loop_asleep() and time.monotonic() - last_frame_time < get_frame_interval():
+        # Rendered inline once the frame is due, or by the main loop when it wakes up
+        return
+    update_display()
+
+def is_loop_asleep():
+    """Check whether the main loop is blocked in an idle back-off wait longer than a frame."""
+    return loop_wait_deadline - time.monotonic() > get_frame_interval()
+
+def is_render_idle():
+    """Check whether the render thread has neither a view to render nor one in flight."""
+    return pending_view is None and not render_busy
+
+def get_wait_time():
+    """Get how long the main loop may block in cv2.waitKey, in milliseconds."""
+    now = time.monotonic()
+    frame_ms = get_frame_interval() * 1000
+    
+    if image is not None:
+        # Pending frame: wake up exactly when the next frame is due
+        if needs_redraw or frame_ready or cursor_dirty:
+            remaining_ms = frame_ms - (now - last_frame_time) * 1000
+            return max(1, int(np.ceil(remaining_ms)))
+        
+        # Render in flight, nothing published yet: check again a frame later
+        if not is_render_idle():
+            return max(1, int(frame_ms))
+    
+    # Recently active: poll once per frame
+    idle = now - last_activity_time
+    if idle < IDLE_AFTER:
+        return max(1, int(frame_ms))
+    
+    # Idle: back off exponentially up to MAX_IDLE_WAIT_MS
+    return int(min(MAX_IDLE_WAIT_MS, frame_ms * 2 ** (idle - IDLE_AFTER + 1)))
+
+def begin_frame_stats(view, preview=False):
+    """Start collecting the stage timings of a frame rendered for a view."""
+    global frame_stats
+    frame_stats = {"requested": view.get("requested"), "preview": preview, "stages": [],
+                   "scaled_bytes": 0, "tid": threading.get_ident(), "start": time.perf_counter()}
+
+def add_stage_time(stage, start, stats=None):
+    """Record a stage that began at start (time.perf_counter()) in a frame's timings."""
+    stats = frame_stats if stats is None else stats
+    if stats is not None:
+        stats["stages"].append((stage, start, time.perf_counter(), threading.get_ident()))
+
+def count_event(counter):
+    """Count a cache hit or miss."""
+    render_counters[counter] += 1
+
+def finish_frame_stats(stats):
+    """Add a shown frame to the rolling statistics and the trace (UI thread only)."""
+    presented = time.perf_counter()
+    stage_ms = {}
+    for stage, start, end, _ in stats["stages"]:
+        stage_ms[stage] = stage_ms.get(stage, 0.0) + (end - start) * 1000
+    
+    # Frame time: rendering (if this is a new frame) plus drawing the cursor layer and showing it
+    frame_ms = (stats["end"] - stats["start"]) * 1000 if "end" in stats else 0.0
+    frame_ms += stage_ms.get("cursor", 0.0) + stage_ms.get("present", 0.0)
+    requested = stats.get("requested")
+    entry = {
+        "presented": presented,
+        "frame_ms": frame_ms,
+        "latency_ms": (presented - requested) * 1000 if requested else None,
+        "stages": stage_ms,
+        "scaled_bytes": stats["scaled_bytes"],
+        "preview": stats["preview"]
+    }
+    with stats_lock:
+        frame_history.append(entry)
+    if trace_file is not None:
+        write_trace_frame(stats, entry)
+
+def get_percentile(sorted_values, fraction):
+    """Get a percentile of a sorted list (nearest rank), or None if it is empty."""
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+def get_render_stats():
+    """Summarize the rolling frame statistics, or None before the first frame.
+
+    Called for every frame by the HUD, so it stays in plain Python on a short list.
+    """
+    with stats_lock:
+        history = list(frame_history)
+    if not history:
+        return None
+    frame_ms = sorted(entry["frame_ms"] for entry in history)
+    latency_ms = sorted(entry["latency_ms"] for entry in history if entry["latency_ms"] is not None)
+    
+    # Frame rate over the last second of activity
+    last = history[-1]["presented"]
+    recent = [entry["presented"] for entry in history if entry["presented"] >= last - 1.0]
+    fps = (len(recent) - 1) / (recent[-1] - recent[0]) if recent[-1] > recent[0] else 0.0
+    return {
+        "history": history,
+        "fps": fps,
+        "frame_ms": get_percentile(frame_ms, 0.5),
+        "frame_p95_ms": get_percentile(frame_ms, 0.95),
+        "latency_ms": get_percentile(latency_ms, 0.5),
+        "latency_p95_ms": get_percentile(latency_ms, 0.95)
+    }
+
+def show_render_stats():
+    """Print where frame time goes and how the caches perform."""
+    stats = get_render_stats()
+    if stats is None:
+        print("No frames rendered yet.")
+        return
+    history = stats["history"]
+    print(f"\n=== RENDER STATISTICS (last {len(history)} frames) ===")
+    print(f"Frame time: {stats['frame_ms']:.2f} ms median, {stats['frame_p95_ms']:.2f} ms p95, {stats['fps']:.1f} FPS")
+    if stats["latency_ms"] is not None:
+        print(f"Input latency: {stats['latency_ms']:.1f} ms median, {stats['latency_p95_ms']:.1f} ms p95")
+    print(f"Previews from coarser levels: {sum(entry['preview'] for entry in history)}")
+    
+    stage_ms = {}
+    for entry in history:
+        for stage, ms in entry["stages"].items():
+            stage_ms[stage] = stage_ms.get(stage, 0.0) + ms
+    print("Mean time per frame and stage:")
+    for stage, ms in sorted(stage_ms.items(), key=lambda item: -item[1]):
+        print(f"  {stage:<12} {ms / len(history):8.3f} ms")
+    
+    counters = dict(render_counters)
+    for label, cache in (("Tile cache", "tile"), ("Overlay cache", "overlay"), ("Image cache", "image_cache")):
+        hits, misses = counters[f"{cache}_hits"], counters[f"{cache}_misses"]
+        rate = f" ({100 * hits / (hits + misses):.1f}% hits)" if hits + misses else ""
+        print(f"{label}: {hits} hits, {misses} misses{rate}")
+    if tk_root_ms is not None:
+        latencies = sorted(dialog_latencies)
+        opened = f", dialogs open in {get_percentile(latencies, 0.5):.0f} ms median" if latencies else ""
+        print(f"Dialogs: Tk root created in {tk_root_ms:.0f} ms{opened}")
+    print(f"Memory: tiles {tile_cache_bytes / 2**20:.1f} of {tile_cache_budget / 2**20:.0f} MB, "
+          f"images {image_cache_bytes / 2**20:.1f} MB, largest scaled region {max(entry['scaled_bytes'] for entry in history) / 2**20:.2f} MB")
+
+def open_trace(file_path, start=None):
+    """Start streaming render timings to a Chrome trace file (chrome://tracing, Perfetto),
+    with timestamps relative to start (default: now)."""
+    global trace_file, trace_start
+    try:
+        trace_file = open(file_path, "w")
+    except OSError as e:
+        print(f"Cannot write trace file {file_path}: {e}")
+        return
+    trace_start = time.perf_counter() if start is None else start
+    trace_file.write("[\n")
+    print(f"Writing render trace to {file_path}")
+
+def trace_event(name, start, end=None, args=None, tid=None):
+    """Write one complete event to the trace file, if tracing is enabled."""
+    if trace_file is None:
+        return
+    end = time.perf_counter() if end is None else end
+    event = {"name": name, "ph": "X", "pid": os.getpid(), "tid": tid or threading.get_ident(),
+             "ts": round((start - trace_start) * 1e6, 1), "dur": round((end - start) * 1e6, 1)}
+    if args:
+        event["args"] = args
+    trace_file.write(json.dumps(event) + ",\n")
+
+def write_trace_frame(stats, entry):
+    """Write the stages of a shown frame and the current cache counters to the trace file."""
+    if "end" in stats:
+        trace_event("preview" if stats["preview"] else "frame", stats["start"], stats["end"],
+                    {"latency_ms": entry["latency_ms"], "scaled_bytes": stats["scaled_bytes"]},
+                    tid=stats["tid"])
+    for stage, start, end, tid in stats["stages"]:
+        trace_event(stage, start, end, tid=tid)
+    counters = dict(render_counters, tile_cache_mb=round(tile_cache_bytes / 2**20, 2))
+    trace_file.write(json.dumps({"name": "caches", "ph": "C", "pid": os.getpid(),
+                                 "ts": round((entry["presented"] - trace_start) * 1e6, 1),
+                                 "args": counters}) + ",\n")
+    trace_file.flush()
+
+def close_trace():
+    """Terminate the trace file so it is valid JSON."""
+    global trace_file
+    if trace_file is None:
+        return
+    trace_file.write(json.dumps({"name": "process_name", "ph": "M", "pid": os.getpid(),
+                                 "args": {"name": "PixelRuler"}}) + "\n]\n")
+    trace_file.close()
+    trace_file = None
+
+def get_level_size(img, level):
+    """Get width and height of a pyramid level (level 0 = original image)."""
+    height, width = img.shape[:2]
+    for _ in range(level):
+        width = (width + 1) // 2
+        height = (height + 1) // 2
+    return width, height
+
+def get_max_level(img):
+    """Get the coarsest pyramid level, the first one that fits into a single tile."""
+    level = 0
+    width, height = get_level_size(img, 0)
+    while max(width, height) > TILE_SIZE:
+        width = (width + 1) // 2
+        height = (height + 1) // 2
+        level += 1
+    return level
+
+def choose_level(img, zoom):
+    """Choose the pyramid level with the least resolution that still covers the zoom."""
+    if zoom >= 1.0:
+        return 0
+    level = int(np.floor(np.log2(1.0 / zoom)))
+    return max(0, min(level, get_max_level(img)))
+
+def tile_cache_get(key):
+    """Get a tile from the LRU cache, or None on a miss."""
+    with tile_cache_lock:
+        tile = tile_cache.get(key)
+        if tile is not None:
+            tile_cache.move_to_end(key)
+        return tile
+
+def tile_cache_put(key, tile):
+    """Put a tile into the LRU cache and evict the oldest tiles over the byte budget."""
+    global tile_cache_bytes
+    with tile_cache_lock:
+        if key in tile_cache:
+            tile_cache_bytes -= tile_cache.pop(key).nbytes
+        tile_cache[key] = tile
+        tile_cache_bytes += tile.nbytes
+        while tile_cache_bytes > tile_cache_budget and len(tile_cache) > 1:
+            _, evicted = tile_cache.popitem(last=False)
+            tile_cache_bytes -= evicted.nbytes
+
+def clear_tile_cache():
+    """Drop all cached tiles."""
+    global tile_cache_bytes
+    with tile_cache_lock:
+        tile_cache.clear()
+        tile_cache_bytes = 0
+
+def get_tile(img, img_key, level, tile_x, tile_y):
+    """Get a tile of a pyramid level (>= 1), building it lazily from the level above."""
+    key = (img_key, level, tile_x, tile_y)
+    tile = tile_cache_get(key)
+    if tile is not None:
+        count_event("tile_hits")
+        return tile
+    count_event("tile_misses")
+    
+    level_width, level_height = get_level_size(img, level)
+    prev_width, prev_height = get_level_size(img, level - 1)
+    x_start = tile_x * TILE_SIZE
+    y_start = tile_y * TILE_SIZE
+    tile_width = min(TILE_SIZE, level_width - x_start)
+    tile_height = min(TILE_SIZE, level_height - y_start)
+    
+    if isinstance(img, MappedRaster) and level > 1:
+        # Mapped rasters: sample every 2^(level-1)-th pixel of the file instead of building the
+        # finer levels first, so a zoomed-out view reads only a fraction of the file
+        step = 2 ** (level - 1)
+        source_region = img[2 * y_start * step:min(img.height, 2 * (y_start + TILE_SIZE) * step):step,
+                            2 * x_start * step:min(img.width, 2 * (x_start + TILE_SIZE) * step):step]
+    else:
+        # Each tile is the INTER_AREA downsample of a 2x2 tile block of the finer level
+        source_region = get_level_region(img, img_key, level - 1, 2 * x_start, 2 * y_start,
+                                         min(prev_width, 2 * (x_start + TILE_SIZE)),
+                                         min(prev_height, 2 * (y_start + TILE_SIZE)))
+    tile = cv2.resize(source_region, (tile_width, tile_height), interpolation=cv2.INTER_AREA)
+    tile_cache_put(key, tile)
+    return tile
+
+def is_level_region_cached(img_key, level, x_start, y_start, x_end, y_end):
+    """Check whether all tiles of a level region are already cached."""
+    if level == 0:
+        return True
+    with tile_cache_lock:
+        for ty in range(y_start // TILE_SIZE, (y_end - 1) // TILE_SIZE + 1):
+            for tx in range(x_start // TILE_SIZE, (x_end - 1) // TILE_SIZE + 1):
+                if (img_key, level, tx, ty) not in tile_cache:
+                    return False
+    return True
+
+def get_level_region(img, img_key, level, x_start, y_start, x_end, y_end):
+    """Get a region of a pyramid level, composited from its tiles."""
+    if level == 0:
+        return img[y_start:y_end, x_start:x_end]
+    
+    first_tx, first_ty = x_start // TILE_SIZE, y_start // TILE_SIZE
+    last_tx, last_ty = (x_end - 1) // TILE_SIZE, (y_end - 1) // TILE_SIZE
+    
+    # Single tile: return a view without copying
+    if first_tx == last_tx and first_ty == last_ty:
+        tile = get_tile(img, img_key, level, first_tx, first_ty)
+        tile_x, tile_y = first_tx * TILE_SIZE, first_ty * TILE_SIZE
+        return tile[y_start - tile_y:y_end - tile_y, x_start - tile_x:x_end - tile_x]
+    
+    region = np.empty((y_end - y_start, x_end - x_start) + img.shape[2:], dtype=img.dtype)
+    for ty in range(first_ty, last_ty + 1):
+        for tx in range(first_tx, last_tx + 1):
+            tile = get_tile(img, img_key, level, tx, ty)
+            tile_x, tile_y = tx * TILE_SIZE, ty * TILE_SIZE
+            
+            # Overlap of tile and requested region in level coordinates
+            ox_start, oy_start = max(x_start, tile_x), max(y_start, tile_y)
+            ox_end = min(x_end, tile_x + tile.shape[1])
+            oy_end = min(y_end, tile_y + tile.shape[0])
+            region[oy_start - y_start:oy_end - y_start, ox_start - x_start:ox_end - x_start] = \
+                tile[oy_start - tile_y:oy_end - tile_y, ox_start - tile_x:ox_end - tile_x]
+    return region
+
+def get_visible_rect(view):
+    """Get the screen rectangle covered by the image, clipped to the viewport, or None."""
+    img_width, img_height = view["image_size"]
+    x_start = max(0, int(np.floor(view["offset_x"])))
+    y_start = max(0, int(np.floor(view["offset_y"])))
+    x_end = min(view["width"], int(np.ceil(view["offset_x"] + img_width * view["zoom"])))
+    y_end = min(view["height"], int(np.ceil(view["offset_y"] + img_height * view["zoom"])))
+    if x_end <= x_start or y_end <= y_start:
+        return None
+    return x_start, y_start, x_end, y_end
+
+def get_level_rect(view, level, screen_rect):
+    """Map a screen rectangle back to pixels of a pyramid level, or None if empty."""
+    level_scale = 2 ** level * view["source_scale"]
+    level_width, level_height = get_level_size(view["image"], level)
+    src_x_start, src_y_start = to_image_coords(screen_rect[0], screen_rect[1], view)
+    src_x_end, src_y_end = to_image_coords(screen_rect[2], screen_rect[3], view)
+    src_x_start = int(np.floor(src_x_start / level_scale))
+    src_y_start = int(np.floor(src_y_start / level_scale))
+    src_x_end = min(level_width, int(np.ceil(src_x_end / level_scale)) + 1)
+    src_y_end = min(level_height, int(np.ceil(src_y_end / level_scale)) + 1)
+    if src_x_end <= src_x_start or src_y_end <= src_y_start:
+        return None
+    return src_x_start, src_y_start, src_x_end, src_y_end
+
+def is_view_cached(view):
+    """Check whether the exact frame for a view can be rendered from cached tiles only."""
+    screen_rect = get_visible_rect(view)
+    if screen_rect is None:
+        return True
+    level = choose_level(view["image"], view["zoom"] * view["source_scale"])
+    level_rect = get_level_rect(view, level, screen_rect)
+    return level_rect is None or is_level_region_cached(view["image_key"], level, *level_rect)
+
+def render_viewport(dst, view, preview=False):
+    """Resample only the source region under the viewport into dst, using the nearest pyramid level.
+
+    In preview mode only already-cached coarser levels are used; returns False
+    if no level is cached yet.
+    """
+    img = view["image"]
+    if img is None:
+        return False
+    screen_rect = get_visible_rect(view)
+    if screen_rect is None:
+        return True
+    x_start, y_start, x_end, y_end = screen_rect
+    
+    level = choose_level(img, view["zoom"] * view["source_scale"])
+    if preview:
+        for level in range(level, get_max_level(img) + 1):
+            level_rect = get_level_rect(view, level, screen_rect)
+            if level_rect is None or is_level_region_cached(view["image_key"], level, *level_rect):
+                break
+        else:
+            return False
+    level_rect = get_level_rect(view, level, screen_rect)
+    if level_rect is None:
+        return True
+    src_x_start, src_y_start, src_x_end, src_y_end = level_rect
+    level_scale = 2 ** level * view["source_scale"]
+    level_zoom = view["zoom"] * level_scale
     
-    elif event == cv2.EVENT_MOUSEMOVE and panning and (flags & cv2.EVENT_FLAG_CTRLKEY):
-        # Optimierung: Nur bei größeren Bewegungen neu zeichnen
-        dx = x - last_mouse_x
-        dy = y - last_mouse_y
-        
-        if abs(dx) > 2 or abs(dy) > 2:  # Mindestbewegung für Update
-            last_mouse_x = x
-            last_mouse_y = y
-            offset_x += dx
-            offset_y += dy
-            needs_redraw = True
-            update_display_throttled()
+    stage_start = time.perf_counter()
+    source_region = get_level_region(img, view["image_key"], level, *level_rect)
+    add_stage_time("tiles", stage_start)
     
-    elif event == cv2.EVENT_LBUTTONUP:
-        panning = False
-        if needs_redraw:
-            update_display()
+    # Resample the region only; its size is bounded by the window, not by the image
+    scaled_width = max(1, int(round((src_x_end - src_x_start) * level_zoom)))
+    scaled_height = max(1, int(round((src_y_end - src_y_start) * level_zoom)))
     
-    elif event == cv2.EVENT_MOUSEWHEEL and (flags & cv2.EVENT_FLAG_CTRLKEY):
-        old_zoom_factor = zoom_factor
-        if flags > 0:
-            zoom_factor *= 1.1
+    # Choose interpolation based on zoom level for better performance/quality trade-off
+    if level_zoom < 1.0 and not preview:
+        interpolation = cv2.INTER_AREA  # Better for downsampling
+    else:
+        interpolation = cv2.INTER_LINEAR  # Faster for upsampling and previews
+    stage_start = time.perf_counter()
+    scaled_region = cv2.resize(source_region, (scaled_width, scaled_height), interpolation=interpolation)
+    add_stage_time("resize", stage_start)
+    if frame_stats is not None:
+        frame_stats["scaled_bytes"] = scaled_region.nbytes
+    
+    # Place the scaled region at its screen position
+    dst_x, dst_y = to_screen_coords(src_x_start * level_scale, src_y_start * level_scale, view)
+    dst_x = int(round(dst_x))
+    dst_y = int(round(dst_y))
+    crop_x = max(0, x_start - dst_x)
+    crop_y = max(0, y_start - dst_y)
+    target_width = min(x_end - x_start, scaled_width - crop_x)
+    target_height = min(y_end - y_start, scaled_height - crop_y)
+    if target_width > 0 and target_height > 0:
+        stage_start = time.perf_counter()
+        dst[y_start:y_start + target_height, x_start:x_start + target_width] = \
+            scaled_region[crop_y:crop_y + target_height, crop_x:crop_x + target_width]
+        add_stage_time("copy", stage_start)
+    return True
+
+def render_frame(dst, view, preview=False):
+    """Render a complete frame (image, measurement overlay, info text) for a view into dst.
+
+    Returns False if a preview was requested but nothing is cached to build it from.
+    """
+    begin_frame_stats(view, preview)
+    if not render_viewport(dst, view, preview):
+        return False
+    
+    # Composite cached measurement overlay; previews only reuse a still valid layer
+    if view["show_measurements"]:
+        composite_overlay(dst, view, allow_render=not preview)
+    
+    if view.get("plane_preview"):
+        stage_start = time.perf_counter()
+        rectify_frame(dst, view)
+        add_stage_time("rectify", stage_start)
+    
+    # Draw info text
+    stage_start = time.perf_counter()
+    draw_info_text(dst, view)
+    add_stage_time("text", stage_start)
+    frame_stats["end"] = time.perf_counter()
+    return True
+
+def rectify_frame(dst, view):
+    """Replace a rendered frame by its top-down view of the calibrated plane (viewport only)."""
+    width, height = view["width"], view["height"]
+    zoom = view["zoom"]
+    screen_to_image = np.float64([[1 / zoom, 0, -view["offset_x"] / zoom],
+                                  [0, 1 / zoom, -view["offset_y"] / zoom],
+                                  [0, 0, 1]])
+    screen_to_plane = get_plane_homography(view["plane_preview"]) @ screen_to_image
+    
+    # Plane area seen by the viewport, limited around the reference (the horizon may be in view)
+    plane_width, plane_height = view["plane_preview"]["size"]
+    extent = PLANE_PREVIEW_EXTENT * max(plane_width, plane_height)
+    corners = np.float64([[0, 0], [width, 0], [width, height], [0, height]])
+    depth = screen_to_plane[2] @ np.column_stack([corners, np.ones(4)]).T
+    if (depth > 0).all():
+        mapped = cv2.perspectiveTransform(corners.reshape(-1, 1, 2), screen_to_plane).reshape(-1, 2)
+        x0, y0 = np.maximum(mapped.min(axis=0), -extent)
+        x1, y1 = np.minimum(mapped.max(axis=0), extent)
+    else:
+        x0, y0, x1, y1 = -extent, -extent, extent, extent
+    if x1 <= x0 or y1 <= y0:
+        return
+    
+    # Fit that area into the viewport, keeping the aspect ratio
+    scale = min(width / (x1 - x0), height / (y1 - y0))
+    fit = np.float64([[scale, 0, (width - scale * (x1 - x0)) / 2 - scale * x0],
+                      [0, scale, (height - scale * (y1 - y0)) / 2 - scale * y0],
+                      [0, 0, 1]])
+    cv2.warpPerspective(dst.copy(), fit @ screen_to_plane, (width, height), dst=dst,
+                        flags=cv2.INTER_LINEAR, borderMode=cv2.BORDER_CONSTANT)
+
+def publish_frame():
+    """Swap the freshly rendered back buffer to the front for the UI thread to show."""
+    global back_buffer, image_display, frame_ready, published_stats
+    with render_lock:
+        back_buffer, image_display = image_display, back_buffer
+        frame_ready = True
+        published_stats = frame_stats
+
+def present_frame():
+    """Show the latest published frame and/or an updated cursor layer, if any (UI thread only)."""
+    global frame_ready, last_frame_time, cursor_frame, cursor_patches, cursor_dirty
+    now = time.monotonic()
+    with render_lock:
+        if not frame_ready and not (cursor_dirty and now - last_frame_time >= get_frame_interval()):
+            return
+        if image_display is None:
+            return
+        
+        # Timings of the rendered frame, or of a cursor-only update
+        if frame_ready and published_stats is not None:
+            stats = published_stats
         else:
-            zoom_factor /= 1.1
-        zoom_factor = max(min_zoom, min(zoom_factor, max_zoom))
+            stats = {"requested": None, "preview": False, "stages": [], "scaled_bytes": 0}
+        if frame_ready and not has_cursor_layer():
+            stage_start = time.perf_counter()
+            cv2.imshow(window_name, image_display)
+            add_stage_time("present", stage_start, stats)
+            frame_ready = cursor_dirty = False
+            cursor_frame = None
+            cursor_patches = []
+            last_frame_time = now
+            finish_frame_stats(stats)
+            return
         
-        factor = zoom_factor / old_zoom_factor
-        offset_x = current_mouse_x - (current_mouse_x - offset_x) * factor
-        offset_y = current_mouse_y - (current_mouse_y - offset_y) * factor
-        needs_redraw = True
-        update_display()
+        # New base frame: take a copy to draw the cursor layer on
+        if frame_ready or cursor_frame is None:
+            if cursor_frame is None or cursor_frame.shape != image_display.shape:
+                cursor_frame = image_display.copy()
+            else:
+                np.copyto(cursor_frame, image_display)
+            cursor_patches = []
+            frame_ready = False
+    
+    stage_start = time.perf_counter()
+    draw_cursor_layer(cursor_frame)
+    add_stage_time("cursor", stage_start, stats)
+    stage_start = time.perf_counter()
+    cv2.imshow(window_name, cursor_frame)
+    add_stage_time("present", stage_start, stats)
+    cursor_dirty = False
+    last_frame_time = now
+    finish_frame_stats(stats)
+
+def has_cursor_layer():
+    """Check whether a rubber-band line or the loupe is currently shown."""
+    return image is not None and (show_loupe or len(points) % 2 == 1 or bool(plane_mode and plane_points))
 
-def update_display_throttled():
-    """Throttled version of update_display for smooth panning."""
-    global last_update_time
-    import time
-    current_time = time.time() * 1000  # Convert to milliseconds
+def mark_cursor_dirty():
+    """Request a redraw of the cursor layer only."""
+    global cursor_dirty
+    cursor_dirty = True
+    if is_loop_asleep():
+        # The main loop would only show it once its idle wait runs out
+        present_frame()
+
+def save_cursor_patch(frame, x0, y0, x1, y1):
+    """Save the frame region that is about to be drawn over; returns False if it is off-screen."""
+    height, width = frame.shape[:2]
+    x0, y0 = max(0, int(x0)), max(0, int(y0))
+    x1, y1 = min(width, int(x1)), min(height, int(y1))
+    if x0 >= x1 or y0 >= y1:
+        return False
+    cursor_patches.append((x0, y0, frame[y0:y1, x0:x1].copy()))
+    return True
+
+def draw_rubber_band(frame):
+    """Draw the line from the pending point to the cursor, with its length."""
+    start_x, start_y = to_screen_coords(*points[-1])
+    start = (int(np.floor(start_x)), int(np.floor(start_y)))
+    end = (current_mouse_x, current_mouse_y)
+    img_x, img_y = to_image_coords(current_mouse_x, current_mouse_y)
+    pixel_length = float(np.hypot(img_x - points[-1][0], img_y - points[-1][1]))
+    label = f"{pixel_length:.1f}px"
+    if image_calibration:
+        label += f" = {pixel_length * image_calibration['scale']:.1f}{image_calibration['unit']}"
     
-    if current_time - last_update_time > update_interval:
-        update_display()
-        last_update_time = current_time
+    (text_width, text_height), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+    text_origin = (end[0] + 12, end[1] - 10)
+    pad = 4
+    save_cursor_patch(frame, min(start[0], end[0]) - pad, min(start[1], end[1]) - pad,
+                      max(start[0], end[0]) + pad + 1, max(start[1], end[1]) + pad + 1)
+    save_cursor_patch(frame, text_origin[0] - 1, text_origin[1] - text_height - 1,
+                      text_origin[0] + text_width + 1, text_origin[1] + baseline + 1)
+    cv2.line(frame, start, end, (0, 255, 255), 1, cv2.LINE_AA)
+    cv2.putText(frame, label, text_origin, cv2.FONT_HERSHEY_SIMPLEX, 0.5, (0, 255, 255), 1)
+
+def draw_plane_outline(frame):
+    """Draw the plane corners clicked so far, connected up to the cursor."""
+    outline = [to_screen_coords(*point) for point in plane_points] + [(current_mouse_x, current_mouse_y)]
+    outline = np.int32(np.floor(outline))
+    x0, y0 = outline.min(axis=0) - 6
+    x1, y1 = outline.max(axis=0) + 7
+    save_cursor_patch(frame, x0, y0, x1, y1)
+    cv2.polylines(frame, [outline.reshape(-1, 1, 2)], len(outline) == 4, (255, 0, 255), 1, cv2.LINE_AA)
+    for point in outline[:-1]:
+        cv2.circle(frame, tuple(int(v) for v in point), 4, (255, 0, 255), -1)
 
-def get_cached_scaled_image():
-    """Get cached scaled image or create new one if needed."""
-    global cached_scaled_image, cached_zoom, image, zoom_factor
+def draw_loupe(frame):
+    """Draw a magnified view of the source pixels around the cursor next to it."""
+    height, width = frame.shape[:2]
+    size = LOUPE_SIZE
     
-    if cached_scaled_image is None or abs(cached_zoom - zoom_factor) > 0.01:
-        if image is None:
-            return None
-            
-        # Scale the image
-        scaled_width = int(image.shape[1] * zoom_factor)
-        scaled_height = int(image.shape[0] * zoom_factor)
+    # Place the loupe below right of the cursor, flipped at the window edges
+    x0 = current_mouse_x + 24 if current_mouse_x + 24 + size <= width else current_mouse_x - 24 - size
+    y0 = current_mouse_y + 24 if current_mouse_y + 24 + size <= height else current_mouse_y - 24 - size
+    x0, y0 = max(0, min(x0, width - size)), max(0, min(y0, height - size))
+    if not save_cursor_patch(frame, x0, y0, x0 + size, y0 + size):
+        return
+    
+    # Map a small ROI of the (possibly reduced) source around the cursor into the loupe
+    img_x, img_y = to_image_coords(current_mouse_x, current_mouse_y)
+    center_x, center_y = img_x / image_source_scale, img_y / image_source_scale
+    scale = zoom_factor * LOUPE_MAGNIFICATION * image_source_scale
+    radius = size / (2 * scale) + 2
+    roi_x0, roi_y0 = max(0, int(center_x - radius)), max(0, int(center_y - radius))
+    roi = image[roi_y0:int(center_y + radius) + 1, roi_x0:int(center_x + radius) + 1]
+    if roi.ndim == 2:
+        roi = cv2.cvtColor(roi, cv2.COLOR_GRAY2BGR)
+    transform = np.float32([[scale, 0, size / 2 - scale * (center_x - roi_x0)],
+                            [0, scale, size / 2 - scale * (center_y - roi_y0)]])
+    interpolation = cv2.INTER_NEAREST if scale >= 1 else cv2.INTER_LINEAR
+    loupe = frame[y0:y0 + size, x0:x0 + size]
+    cv2.warpAffine(np.ascontiguousarray(roi), transform, (size, size), dst=loupe, flags=interpolation,
+                   borderMode=cv2.BORDER_CONSTANT, borderValue=(0, 0, 0))
+    
+    # Crosshair and frame
+    middle = size // 2
+    cv2.line(loupe, (middle, 0), (middle, size - 1), (0, 255, 255), 1)
+    cv2.line(loupe, (0, middle), (size - 1, middle), (0, 255, 255), 1)
+    cv2.rectangle(loupe, (0, 0), (size - 1, size - 1), (255, 255, 255), 1)
+
+def draw_cursor_layer(frame):
+    """Restore the regions covered by the previous cursor layer, then draw the current one."""
+    global cursor_patches
+    for x, y, patch in reversed(cursor_patches):
+        frame[y:y + patch.shape[0], x:x + patch.shape[1]] = patch
+    cursor_patches = []
+    if image is None:
+        return
+    if len(points) % 2 == 1:
+        draw_rubber_band(frame)
+    if plane_mode and plane_points:
+        draw_plane_outline(frame)
+    if show_loupe:
+        draw_loupe(frame)
+
+def toggle_loupe():
+    """Toggle the magnifier loupe at the cursor."""
+    global show_loupe, needs_redraw
+    show_loupe = not show_loupe
+    needs_redraw = True
+    update_display()
+    print(f"Loupe {'on' if show_loupe else 'off'}")
+
+def render_worker():
+    """Render thread: always renders the latest requested view and drops intermediate ones."""
+    global pending_view, back_buffer, render_busy
+    last_publish_time = 0.0
+    while True:
+        with render_condition:
+            while pending_view is None:
+                render_condition.wait()
+            render_busy = True
         
-        if scaled_width <= 0 or scaled_height <= 0:
-            return None
-            
-        # Choose interpolation based on zoom level for better performance/quality trade-off
-        if zoom_factor < 1.0:
-            interpolation = cv2.INTER_AREA  # Better for downsampling
-        else:
-            interpolation = cv2.INTER_LINEAR  # Faster for upsampling
+        # Frame pacing: give further requests until the next frame is due to coalesce
+        delay = last_publish_time + get_frame_interval() - time.monotonic()
+        if delay > 0:
+            time.sleep(delay)
+        with render_condition:
+            view = pending_view
+            pending_view = None
+        
+        try:
+            if not is_view_cached(view):
+                # Show a cheap preview from an already-cached coarser level first
+                back_buffer = ensure_frame_buffer(back_buffer, view["width"], view["height"])
+                if render_frame(back_buffer, view, preview=True):
+                    publish_frame()
+                with render_condition:
+                    if pending_view is not None:
+                        render_busy = False
+                        continue
             
-        cached_scaled_image = cv2.resize(image, (scaled_width, scaled_height), interpolation=interpolation)
-        cached_zoom = zoom_factor
-    
-    return cached_scaled_image
+            back_buffer = ensure_frame_buffer(back_buffer, view["width"], view["height"])
+            render_frame(back_buffer, view)
+            publish_frame()
+            last_publish_time = time.monotonic()
+        except Exception as e:
+            print(f"Render error: {e}")
+        finally:
+            render_busy = False
+
+def start_render_thread():
+    """Start the background render thread."""
+    global render_thread
+    if render_thread is None:
+        render_thread = threading.Thread(target=render_worker, name="PixelRulerRender", daemon=True)
+        render_thread.start()
 
 def update_display():
-    """Update image display with zoom, panning and measurements."""
-    global image_display, needs_redraw
+    """Request a frame with zoom, panning and measurements for the current view."""
+    global pending_view, back_buffer, needs_redraw
     if image is None or not needs_redraw:
         return
-        
-    disp_height, disp_width = image.shape[:2]
-    image_display = np.zeros_like(image)
+    view = get_view_state()
+    needs_redraw = False
     
-    scaled_image = get_cached_scaled_image()
-    if scaled_image is None:
-        cv2.imshow(window_name, image_display)
+    if render_thread is None or (is_loop_asleep() and is_render_idle()):
+        # No render thread (e.g. before main() started it), or the main loop sleeps in its
+        # idle back-off and would show the frame late: render and show it synchronously
+        back_buffer = ensure_frame_buffer(back_buffer, view["width"], view["height"])
+        render_frame(back_buffer, view)
+        publish_frame()
+        present_frame()
         return
-
-    # Calculate visible area
-    x_start = int(offset_x)
-    y_start = int(offset_y)
-    x_end = min(disp_width, x_start + scaled_image.shape[1])
-    y_end = min(disp_height, y_start + scaled_image.shape[0])
     
-    src_x_start = max(0, -x_start)
-    src_y_start = max(0, -y_start)
-    src_x_end = src_x_start + (x_end - max(0, x_start))
-    src_y_end = src_y_start + (y_end - max(0, y_start))
+    with render_condition:
+        pending_view = view
+        render_condition.notify()
+
+def invalidate_overlay():
+    """Mark the cached measurement overlay as stale (style, selection or visibility changed)."""
+    global measurements_version
+    measurements_version += 1
+
+def invalidate_geometry(rows=None):
+    """Mark measurement positions as changed and re-register the given rows in the spatial index.
+
+    rows are moved or appended rows; rows beyond the end of the table were deleted from it.
+    Without rows (table replaced, or rows deleted from the middle) the index is rebuilt lazily.
+    """
+    global geometry_version, segment_index
+    invalidate_overlay()
+    geometry_version += 1
+    index = segment_index
+    if rows is None or index is None or index["version"] != geometry_version - 1:
+        segment_index = None
+        return
+    index = update_segment_index(index, measurements, np.asarray(rows, dtype=np.int64))
+    if index is not None:
+        index["version"] = geometry_version
+    segment_index = index
+
+def get_segment_cells(x0, y0, x1, y1, cell):
+    """Walk segments cell by cell; returns (segment, cx, cy) arrays, one entry per crossed cell."""
+    x0, y0, x1, y1 = (np.asarray(v, dtype=np.float64) / cell for v in (x0, y0, x1, y1))
+    count = len(x0)
+    dx, dy = x1 - x0, y1 - y0
     
-    x_start = max(0, x_start)
-    y_start = max(0, y_start)
+    # Segment parameters t where each segment crosses a vertical or horizontal grid line
+    segments, params = [np.arange(count)], [np.zeros(count)]
+    for start, end, delta in ((x0, x1, dx), (y0, y1, dy)):
+        c0, c1 = np.floor(start).astype(np.int64), np.floor(end).astype(np.int64)
+        crossings = np.abs(c1 - c0)
+        segment = np.repeat(np.arange(count), crossings)
+        step = np.arange(len(segment)) - np.repeat(np.cumsum(crossings) - crossings, crossings)
+        boundary = np.repeat(np.minimum(c0, c1), crossings) + 1 + step
+        segments.append(segment)
+        params.append((boundary - start[segment]) / delta[segment])
+    segment, t = np.concatenate(segments), np.concatenate(params)
+    order = np.argsort(segment + t / 2)  # by segment, then along it (t <= 1)
+    segment, t = segment[order], t[order]
     
-    target_width = x_end - x_start
-    target_height = y_end - y_start
+    # Each cell is entered at one crossing and left at the next one (or at the segment end)
+    t_next = np.append(t[1:], 1.0)
+    t_next[np.append(segment[1:] != segment[:-1], True)] = 1.0
+    middle = (t + t_next) / 2
+    cx = np.floor(x0[segment] + middle * dx[segment]).astype(np.int64)
+    cy = np.floor(y0[segment] + middle * dy[segment]).astype(np.int64)
+    return segment, cx, cy
+
+def group_segment_cells(rows, cx, cy):
+    """Group rows by cell: {(cx, cy): array of rows}."""
+    if not len(rows):
+        return {}
+    key = (cy - cy.min()) * (int(cx.max() - cx.min()) + 1) + (cx - cx.min())
+    order = np.argsort(key, kind="stable")
+    rows, cx, cy = rows[order], cx[order], cy[order]
+    starts = np.flatnonzero(np.append(True, (cx[1:] != cx[:-1]) | (cy[1:] != cy[:-1])))
+    return dict(zip(zip(cx[starts].tolist(), cy[starts].tolist()), np.split(rows, starts[1:])))
+
+def get_cell_bounds(keys, bounds=None):
+    """Get (min cx, min cy, max cx, max cy) of cell keys, widened to include earlier bounds."""
+    cx, cy = zip(*keys)
+    if bounds:
+        cx, cy = cx + (bounds[0], bounds[2]), cy + (bounds[1], bounds[3])
+    return min(cx), min(cy), max(cx), max(cy)
+
+def build_segment_index(table):
+    """Build a uniform grid of the cells the segments of a measurement table cross."""
+    segments = np.column_stack([table["x0"], table["y0"], table["x1"], table["y1"]]).astype(np.float64)
+    if not len(table):
+        return {"cell": 1.0, "cells": {}, "segments": segments, "bounds": None}
+    extent = max(segments[:, 0::2].max() - segments[:, 0::2].min(), segments[:, 1::2].max() - segments[:, 1::2].min())
+    cell = max(extent / SPATIAL_GRID_CELLS, 1.0)
     
-    if target_width > 0 and target_height > 0 and src_x_end > src_x_start and src_y_end > src_y_start:
-        source_region = scaled_image[src_y_start:src_y_end, src_x_start:src_x_end]
-        if source_region.shape[0] != target_height or source_region.shape[1] != target_width:
-            source_region = cv2.resize(source_region, (target_width, target_height), interpolation=cv2.INTER_LINEAR)
-        image_display[y_start:y_end, x_start:x_end] = source_region
+    cells = group_segment_cells(*get_segment_cells(*segments.T, cell))
+    return {"cell": cell, "cells": cells, "segments": segments, "bounds": get_cell_bounds(cells)}
 
-    # Draw measurements
-    if show_measurements:
-        draw_measurements()
+def update_segment_index(index, table, rows):
+    """Get a copy of an index with only some rows re-registered; None if a rebuild is cheaper.
+
+    The cached index is replaced, never modified, since the render thread may be reading it.
+    """
+    cell, segments = index["cell"], index["segments"]
+    old = rows[rows < len(segments)]
+    new = rows[rows < len(table)]
+    if len(segments) - len(table) != np.count_nonzero(rows >= len(table)) - np.count_nonzero(rows >= len(segments)):
+        return None  # rows were deleted from the middle, shifting the others
     
-    # Draw info text
-    draw_info_text()
+    segment, cx, cy = get_segment_cells(*np.column_stack([table["x0"][new], table["y0"][new],
+                                                          table["x1"][new], table["y1"][new]]).T, cell)
+    if len(segment) > 4 * SPATIAL_GRID_CELLS * max(1, len(new)):
+        return None  # much longer than the grid was sized for
     
-    cv2.imshow(window_name, image_display)
-    needs_redraw = False
+    # Unregister the rows from the cells they crossed before
+    cells = dict(index["cells"])
+    for key, group in group_segment_cells(*get_segment_cells(*segments[old].T, cell)).items():
+        remaining = cells[key][~np.isin(cells[key], old[group])]
+        if len(remaining):
+            cells[key] = remaining
+        else:
+            del cells[key]
+    
+    # Register them in the cells they cross now
+    added = group_segment_cells(new[segment], cx, cy)
+    for key, group in added.items():
+        cells[key] = np.concatenate([cells[key], group]) if key in cells else group
+    segments = np.resize(segments, (len(table), 4))
+    segments[new] = np.column_stack([table["x0"][new], table["y0"][new], table["x1"][new], table["y1"][new]])
+    bounds = get_cell_bounds(added, index["bounds"]) if added else index["bounds"]
+    return {"cell": cell, "cells": cells, "segments": segments, "bounds": bounds}
+
+def get_segment_index(table, version=None):
+    """Get the spatial index of a table, reusing the cached one if it was built for the same version."""
+    global segment_index
+    index = segment_index
+    if version is not None and index is not None and index["version"] == version:
+        return index
+    index = build_segment_index(table)
+    index["version"] = version
+    # The render thread may build one for an older view: never replace a newer index with it
+    if version is not None and (segment_index is None or segment_index["version"] < version):
+        segment_index = index
+    return index
+
+def query_segment_index(index, x0, y0, x1, y1):
+    """Get the rows whose cells overlap an image rectangle (a superset of the hits)."""
+    cell, cells, bounds = index["cell"], index["cells"], index["bounds"]
+    cx0, cy0 = int(np.floor(max(x0, -1e12) / cell)), int(np.floor(max(y0, -1e12) / cell))
+    cx1, cy1 = int(np.floor(min(x1, 1e12) / cell)), int(np.floor(min(y1, 1e12) / cell))
+    if bounds and cx0 <= bounds[0] and cy0 <= bounds[1] and cx1 >= bounds[2] and cy1 >= bounds[3]:
+        # The rectangle covers every cell: all rows
+        return np.arange(len(index["segments"]))
+    if (cx1 - cx0 + 1) * (cy1 - cy0 + 1) >= len(cells):
+        hits = [rows for (cx, cy), rows in cells.items() if cx0 <= cx <= cx1 and cy0 <= cy <= cy1]
+    else:
+        hits = [cells[(cx, cy)] for cy in range(cy0, cy1 + 1) for cx in range(cx0, cx1 + 1) if (cx, cy) in cells]
+    return np.unique(np.concatenate(hits)) if hits else np.zeros(0, dtype=np.int64)
 
-def draw_measurements():
-    """Draw measurements on the display (separated for better performance)."""
-    global image_display
+def hit_test(x_img, y_img, radius):
+    """Find the measurement under an image point.
+
+    Returns (row, "start" or "end") for an endpoint within radius, (row, None) for a
+    line within radius, or None.
+    """
+    rows = query_segment_index(get_segment_index(measurements, geometry_version),
+                               x_img - radius, y_img - radius, x_img + radius, y_img + radius)
+    if not len(rows):
+        return None
+    table = measurements[rows]
+    start_distance = np.hypot(table["x0"] - x_img, table["y0"] - y_img)
+    end_distance = np.hypot(table["x1"] - x_img, table["y1"] - y_img)
+    nearest = int(np.argmin(np.minimum(start_distance, end_distance)))
+    if min(start_distance[nearest], end_distance[nearest]) <= radius:
+        return int(rows[nearest]), "start" if start_distance[nearest] <= end_distance[nearest] else "end"
+    
+    # Distance to the segments: project the point onto each line and clamp to its ends
+    dx, dy = table["x1"] - table["x0"], table["y1"] - table["y0"]
+    t = np.clip(((x_img - table["x0"]) * dx + (y_img - table["y0"]) * dy) / np.maximum(dx * dx + dy * dy, 1e-12), 0, 1)
+    line_distance = np.hypot(table["x0"] + t * dx - x_img, table["y0"] + t * dy - y_img)
+    nearest = int(np.argmin(line_distance))
+    if line_distance[nearest] <= radius:
+        return int(rows[nearest]), None
+    return None
+
+def draw_measurements(dst, view, shift_x=0, shift_y=0):
+    """Draw measurements of a view into dst, with screen coordinates shifted by (shift_x, shift_y).
+
+    Line and label sizes follow the zoom, unless the view sets a fixed "style_scale".
+    """
+    dst_height, dst_width = dst.shape[:2]
+    style = view.get("style_scale", view["zoom"])
+    selected = view.get("selected", ())
     
-    disp_height, disp_width = image_display.shape[:2]
+    # Only rows near the target area (plus a pixel of slack for flooring) are considered
+    index = view.get("segment_index") or get_segment_index(view["measurements"], view.get("geometry_version"))
+    zoom = view["zoom"]
+    left = (-shift_x - view["offset_x"] - 1) / zoom
+    top = (-shift_y - view["offset_y"] - 1) / zoom
+    right = (dst_width - shift_x - view["offset_x"] + 1) / zoom
+    bottom = (dst_height - shift_y - view["offset_y"] + 1) / zoom
+    table = view["measurements"][query_segment_index(index, left, top, right, bottom)]
     
-    for i, measurement in enumerate(measurements):
-        start_x, start_y = to_screen_coords(measurement["start"]["x"], measurement["start"]["y"])
-        end_x, end_y = to_screen_coords(measurement["end"]["x"], measurement["end"]["y"])
-        
-        start_x = max(0, min(int(start_x), disp_width - 1))
-        start_y = max(0, min(int(start_y), disp_height - 1))
-        end_x = max(0, min(int(end_x), disp_width - 1))
-        end_y = max(0, min(int(end_y), disp_height - 1))
+    # Transform all endpoints to screen coordinates at once
+    start_x, start_y = to_screen_coords(table["x0"], table["y0"], view)
+    end_x, end_y = to_screen_coords(table["x1"], table["y1"], view)
+    start_x = np.floor(start_x).astype(np.int64) + shift_x
+    start_y = np.floor(start_y).astype(np.int64) + shift_y
+    end_x = np.floor(end_x).astype(np.int64) + shift_x
+    end_y = np.floor(end_y).astype(np.int64) + shift_y
+    
+    # Cull segments (and their labels) that lie fully outside the target
+    visible = ~((np.maximum(start_x, end_x) < 0) | (np.minimum(start_x, end_x) >= dst_width) |
+                (np.maximum(start_y, end_y) < 0) | (np.minimum(start_y, end_y) >= dst_height))
+    
+    for i in np.flatnonzero(visible).tolist():
+        measurement = table[i]
+        start = (int(start_x[i]), int(start_y[i]))
+        end = (int(end_x[i]), int(end_y[i]))
         
         # Different colors for different measurements
-        colors = [(0, 255, 0), (255, 0, 0), (0, 0, 255), (255, 255, 0), (255, 0, 255), (0, 255, 255)]
-        color = colors[i % len(colors)]
+        color = MEASUREMENT_COLORS[(int(measurement["id"]) - 1) % len(MEASUREMENT_COLORS)]
         
-        # Draw line
-        line_thickness = max(1, int(2 * zoom_factor))
-        cv2.line(image_display, (start_x, start_y), (end_x, end_y), color, line_thickness)
+        # Draw line, with a white halo when selected
+        line_thickness = max(1, int(2 * style))
+        circle_radius = max(2, int(3 * style))
+        if int(measurement["id"]) in selected:
+            cv2.line(dst, start, end, (255, 255, 255), line_thickness + 4)
+            cv2.circle(dst, start, circle_radius + 2, (255, 255, 255), -1)
+            cv2.circle(dst, end, circle_radius + 2, (255, 255, 255), -1)
+        cv2.line(dst, start, end, color, line_thickness)
         
         # Mark endpoints
-        circle_radius = max(2, int(3 * zoom_factor))
-        cv2.circle(image_display, (start_x, start_y), circle_radius, color, -1)
-        cv2.circle(image_display, (end_x, end_y), circle_radius, color, -1)
+        cv2.circle(dst, start, circle_radius, color, -1)
+        cv2.circle(dst, end, circle_radius, color, -1)
         
         # Display text (only if zoom is sufficient for readability)
-        if zoom_factor > 0.3:
-            mid_x = (start_x + end_x) // 2
-            mid_y = (start_y + end_y) // 2
+        if style > 0.3:
+            mid_x = (start[0] + end[0]) // 2
+            mid_y = (start[1] + end[1]) // 2
             
-            text_lines = [f"#{measurement['id']}: {measurement['pixel_length']:.1f}px"]
-            if measurement.get("real_world_length"):
-                unit = measurement["reference_object"].get("unit", "mm")
+            auto = " (auto)" if measurement["auto_detected"] else ""
+            text_lines = [f"#{measurement['id']}{auto}: {measurement['pixel_length']:.1f}px"]
+            if measurement["real_world_length"] > 0:
+                unit = get_reference_unit(int(measurement["reference"]), view.get("calibration_unit", ""))
                 text_lines.append(f"{measurement['real_world_length']:.1f}{unit}")
+            if measurement["rectified_length"] > 0:
+                text_lines.append(f"{measurement['rectified_length']:.1f}{view.get('plane_unit', '')} (plane)")
             
-            font_scale = max(0.4, 0.5 * zoom_factor)
-            thickness = max(1, int(1 * zoom_factor))
+            font_scale = max(0.4, 0.5 * style)
+            thickness = max(1, int(1 * style))
+            line_height = max(15, int(30 * font_scale))
             
             for j, text in enumerate(text_lines):
-                text_y = mid_y - 10 + j * 15
-                cv2.putText(image_display, text, (mid_x, text_y), 
+                text_y = mid_y - line_height * 2 // 3 + j * line_height
+                cv2.putText(dst, text, (mid_x, text_y), 
                            cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness)
 
-def draw_info_text():
+def render_overlay(view):
+    """Render the measurement overlay layer for a view, including a margin around the viewport."""
+    global overlay_layer, overlay_mask, overlay_version, overlay_zoom, overlay_offset
+    margin_x = int(view["width"] * OVERLAY_MARGIN)
+    margin_y = int(view["height"] * OVERLAY_MARGIN)
+    shape = (view["height"] + 2 * margin_y, view["width"] + 2 * margin_x, 3)
+    
+    if overlay_layer is None or overlay_layer.shape != shape:
+        overlay_layer = np.zeros(shape, dtype=np.uint8)
+    else:
+        overlay_layer.fill(0)
+    draw_measurements(overlay_layer, view, margin_x, margin_y)
+    overlay_mask = cv2.compare(cv2.cvtColor(overlay_layer, cv2.COLOR_BGR2GRAY), 0, cv2.CMP_GT)
+    
+    overlay_version = (view["image_key"], view["measurements_version"])
+    overlay_zoom = view["zoom"]
+    overlay_offset = (view["offset_x"], view["offset_y"])
+
+def composite_overlay(dst, view, allow_render=True):
+    """Composite the cached overlay into dst, re-rendering it only when it is stale."""
+    width, height = view["width"], view["height"]
+    margin_x = int(width * OVERLAY_MARGIN)
+    margin_y = int(height * OVERLAY_MARGIN)
+    
+    # A pure pan translates the cached layer; anything else re-renders it
+    shift_x = int(round(view["offset_x"] - overlay_offset[0]))
+    shift_y = int(round(view["offset_y"] - overlay_offset[1]))
+    if (overlay_layer is None or overlay_version != (view["image_key"], view["measurements_version"]) or
+            overlay_zoom != view["zoom"] or
+            overlay_layer.shape[:2] != (height + 2 * margin_y, width + 2 * margin_x) or
+            abs(shift_x) > margin_x or abs(shift_y) > margin_y):
+        if not allow_render:
+            return
+        count_event("overlay_misses")
+        stage_start = time.perf_counter()
+        render_overlay(view)
+        add_stage_time("measurements", stage_start)
+        shift_x = shift_y = 0
+    else:
+        count_event("overlay_hits")
+    
+    x_start = margin_x - shift_x
+    y_start = margin_y - shift_y
+    layer = overlay_layer[y_start:y_start + height, x_start:x_start + width]
+    mask = overlay_mask[y_start:y_start + height, x_start:x_start + width]
+    stage_start = time.perf_counter()
+    cv2.copyTo(layer, mask, dst)
+    add_stage_time("overlay", stage_start)
+
+def draw_info_text(dst, view):
     """Draw info text in corner."""
     info_text = [
-        f"Zoom: {zoom_factor:.2f}x",
-        f"Measurements: {len(measurements)}",
-        f"CPU Opt: ON"
+        f"Zoom: {view['zoom']:.2f}x",
+        f"Measurements: {len(view['measurements'])}"
     ]
     
+    # Live timings of the previous frames
+    stats = get_render_stats()
+    if stats is not None:
+        info_text.append(f"Frame: {stats['frame_ms']:.1f} ms (p95 {stats['frame_p95_ms']:.1f}), {stats['fps']:.0f} FPS")
+        if stats["latency_ms"] is not None:
+            info_text.append(f"Latency: {stats['latency_ms']:.0f} ms (p95 {stats['latency_p95_ms']:.0f})")
+    
     for i, text in enumerate(info_text):
-        cv2.putText(image_display, text, (10, 20 + i * 20), 
+        cv2.putText(dst, text, (10, 20 + i * 20), 
                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 1)
 
 def get_save_path():
-    """Generate file path for measurements based on image name."""
-    if current_image_path:
-        base_name = os.path.splitext(os.path.basename(current_image_path))[0]
-        return f"{base_name}_measurements.json"
-    return "measurements.json"
+    """Generate file path for measurements: a sidecar next to the image, or a digest-keyed
+    file in the user's measurement store if the image folder is read-only."""
+    if not current_image_path:
+        return "measurements.json"
+    directory = os.path.dirname(os.path.abspath(current_image_path))
+    if os.access(directory, os.W_OK):
+        return f"{os.path.splitext(current_image_path)[0]}_measurements.json"
+    os.makedirs(MEASUREMENT_STORE_DIR, exist_ok=True)
+    return os.path.join(MEASUREMENT_STORE_DIR, f"{current_image_digest}_measurements.json")
+
+def get_legacy_save_path():
+    """Get the basename-keyed path in the working directory used by older versions."""
+    base_name = os.path.splitext(os.path.basename(current_image_path))[0]
+    return f"{base_name}_measurements.json"
+
+def is_same_image(data):
+    """Check whether measurement data belongs to the current image, by digest or, for old files, by path."""
+    if data.get("image_digest"):
+        return data["image_digest"] == current_image_digest
+    return os.path.abspath(data.get("image_path") or "") == os.path.abspath(current_image_path)
+
+def get_journal_path():
+    """Generate file path for the measurement journal next to the snapshot file."""
+    return os.path.splitext(get_save_path())[0] + ".journal.jsonl"
+
+def journal_append(record):
+    """Append one add/delete record to the measurement journal, compacting it periodically."""
+    global journal_records
+    filename = get_journal_path()
+    with open(filename, "a", encoding="utf-8") as f:
+        f.write(json.dumps(record, ensure_ascii=False) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+    journal_records += 1
+    print(f"Measurements saved to: {filename}")
+    
+    # Mirror the change into the case database, if enabled
+    if measurement_db is not None:
+        db_apply_record(measurement_db, record)
+    
+    if journal_records >= JOURNAL_COMPACT_EVERY:
+        save_measurements()
 
 def save_measurements():
-    """Save measurements to JSON file."""
-    if not measurements:
+    """Compact measurements into the JSON snapshot file (atomic rename) and clear the journal."""
+    global journal_records
+    filename = get_save_path()
+    journal_path = get_journal_path()
+    if (not len(measurements) and not image_plane and not os.path.exists(filename)
+            and not os.path.exists(journal_path)):
         return
     
     data = {
         "image_path": current_image_path,
-        "image_size": {"width": image.shape[1], "height": image.shape[0]} if image is not None else None,
+        "image_digest": current_image_digest,
+        "image_size": {"width": image_width, "height": image_height} if image is not None else None,
         "created": datetime.now().isoformat(),
-        "measurements": measurements
+        "measurements": measurements_to_dicts(measurements)
     }
+    if image_calibration:
+        data["calibration"] = image_calibration
+    if image_plane:
+        data["plane"] = image_plane
+    write_json_atomic(filename, data)
     
-    filename = get_save_path()
-    with open(filename, "w", encoding="utf-8") as f:
-        json.dump(data, f, indent=4, ensure_ascii=False)
+    if os.path.exists(journal_path):
+        os.remove(journal_path)
+    journal_records = 0
     print(f"Measurements saved to: {filename}")
 
+def write_json_atomic(file_path, data):
+    """Write JSON via a temporary file and rename, so a crash never leaves a half-written file."""
+    temp_path = file_path + ".tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(temp_path, file_path)
+
+def replay_journal(entries, journal_path):
+    """Apply journal records to a list of measurements; returns the number of records applied.
+
+    Adds are upserts by id: a crash between writing the snapshot and removing the journal
+    leaves records whose measurements the snapshot already contains.
+    """
+    count = 0
+    rows = {m["id"]: row for row, m in enumerate(entries)}
+    with open(journal_path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A crash during append can only truncate the last record
+                print(f"Warning: ignoring truncated journal record in {journal_path}")
+                break
+            if record.get("op") in ("add", "update"):
+                measurement = record["measurement"]
+                row = rows.get(measurement["id"])
+                if row is not None:
+                    entries[row] = measurement
+                elif record["op"] == "add":
+                    rows[measurement["id"]] = len(entries)
+                    entries.append(measurement)
+            elif record.get("op") == "delete":
+                entries[:] = [m for m in entries if m["id"] != record["id"]]
+                rows = {m["id"]: row for row, m in enumerate(entries)}
+            count += 1
+    return count
+
 def load_measurements():
-    """Load measurements from JSON file."""
-    global measurements, needs_redraw
+    """Load measurements from the JSON snapshot file and replay the journal on top."""
+    global measurements, needs_redraw, journal_records, image_calibration, image_plane
     filename = get_save_path()
-    if os.path.exists(filename):
-        try:
+    journal_path = get_journal_path()
+    journal_records = 0
+    
+    # Migrate a file written by older versions to the working directory, but only
+    # if it really belongs to this image (same-named images from other folders don't)
+    migrated = False
+    if not os.path.exists(filename) and not os.path.exists(journal_path):
+        legacy_path = get_legacy_save_path()
+        if os.path.abspath(legacy_path) == os.path.abspath(filename) or not os.path.exists(legacy_path):
+            return
+        filename = legacy_path
+        migrated = True
+    
+    try:
+        entries = []
+        if os.path.exists(filename):
             with open(filename, "r", encoding="utf-8") as f:
                 data = json.load(f)
-            measurements = data.get("measurements", [])
-            needs_redraw = True
-            print(f"Measurements loaded: {len(measurements)} entries")
-        except Exception as e:
-            print(f"Error loading measurements: {e}")
+            if migrated and not is_same_image(data):
+                return
+            if data.get("image_digest") and data["image_digest"] != current_image_digest:
+                print("Warning: image content changed since these measurements were saved.")
+            entries = data.get("measurements", [])
+            image_calibration = data.get("calibration")
+            image_plane = data.get("plane")
+        replayed = os.path.exists(journal_path)
+        if replayed:
+            journal_records = replay_journal(entries, journal_path)
+        measurements = measurements_from_dicts(entries)
+        if image_plane:
+            rectify_measurements(measurements, image_plane)
+        invalidate_geometry()
+        needs_redraw = True
+        print(f"Measurements loaded: {len(measurements)} entries")
+        
+        # Fold a left-over journal (e.g. after a crash) or a migrated file into a fresh snapshot
+        if replayed or migrated:
+            save_measurements()
+    except Exception as e:
+        print(f"Error loading measurements: {e}")
 
 def toggle_measurements():
     """Toggle measurement display on/off."""
     global show_measurements, needs_redraw
     show_measurements = not show_measurements
+    invalidate_overlay()
     needs_redraw = True
     update_display()
     print(f"Measurements {'shown' if show_measurements else 'hidden'}")
@@ -451,129 +2759,759 @@ def toggle_measurements():
 def delete_last_measurement():
     """Delete the last measurement."""
     global measurements, points, needs_redraw
-    if measurements:
-        deleted = measurements.pop()
+    if len(measurements):
+        deleted_id = int(measurements["id"][-1])
+        was_reference = measurements["reference"][-1] >= 0
+        measurements = measurements[:-1]
+        invalidate_geometry([len(measurements)])
         if len(points) >= 2:
             points.pop()
             points.pop()
         needs_redraw = True
         update_display()
-        save_measurements()
-        print(f"Measurement #{deleted['id']} deleted.")
+        journal_append({"op": "delete", "id": deleted_id})
+        print(f"Measurement #{deleted_id} deleted.")
+        if was_reference:
+            refresh_calibration()
     else:
         print("No measurements to delete.")
 
+def delete_selected_measurements():
+    """Delete all selected measurements."""
+    global measurements, needs_redraw
+    if not selected_ids:
+        print("No measurements selected (Shift + click a line to select it).")
+        return
+    
+    keep = ~np.isin(measurements["id"], list(selected_ids))
+    deleted = measurements["id"][~keep].tolist()
+    was_reference = (measurements["reference"][~keep] >= 0).any()
+    measurements = measurements[keep]
+    selected_ids.clear()
+    invalidate_geometry()
+    needs_redraw = True
+    update_display()
+    for measurement_id in deleted:
+        journal_append({"op": "delete", "id": measurement_id})
+    print(f"Deleted measurements: {', '.join(f'#{i}' for i in deleted)}")
+    if was_reference:
+        refresh_calibration()
+
+def recompute_rows(rows):
+    """Recompute lengths and real-world values of some rows of the current measurements."""
+    table = recompute_measurements(measurements[rows])
+    if image_calibration:
+        apply_image_scale(table, image_calibration)
+    measurements[rows] = rectify_measurements(table, image_plane)
+
 def show_measurement_list():
     """Show list of all measurements."""
-    if not measurements:
+    if not len(measurements):
         print("No measurements available.")
         return
     
     print(f"\n=== Measurements for {os.path.basename(current_image_path)} ===")
-    for m in measurements:
-        print(f"\nMeasurement #{m['id']}:")
-        print(f"  Pixel length: {m['pixel_length']:.2f} px")
-        if m.get("real_world_length"):
-            unit = m["reference_object"].get("unit", "mm")
-            print(f"  Real length: {m['real_world_length']:.2f} {unit}")
-        if m.get("reference_object"):
-            print(f"  Reference: {m['reference_object']['name']}")
+    calibration_unit = image_calibration["unit"] if image_calibration else ""
+    if image_calibration:
+        print(f"Calibration: {format_calibration(image_calibration)}")
+    columns = zip(measurements["id"].tolist(), measurements["pixel_length"].tolist(),
+                  measurements["real_world_length"].tolist(), measurements["scale_factor"].tolist(),
+                  measurements["reference"].tolist(), measurements["rectified_length"].tolist())
+    for measurement_id, pixel_length, real_world_length, scale_factor, reference, rectified_length in columns:
+        print(f"\nMeasurement #{measurement_id}:")
+        print(f"  Pixel length: {pixel_length:.2f} px")
+        if real_world_length > 0:
+            print(f"  Real length: {real_world_length:.2f} {get_reference_unit(reference, calibration_unit)}")
+        if reference >= 0:
+            print(f"  Reference: {reference_table[reference]['name']}")
         else:
             print(f"  Reference: None (pixel only)")
-        if m.get("scale_factor"):
-            unit = m["reference_object"].get("unit", "mm")
-            print(f"  Scale: 1 px = {m['scale_factor']:.4f} {unit}")
+        if scale_factor > 0:
+            print(f"  Scale: 1 px = {scale_factor:.4f} {get_reference_unit(reference, calibration_unit)}")
+        if rectified_length > 0:
+            print(f"  On plane: {rectified_length:.2f} {image_plane['unit']}")
+
+def select_plane_reference():
+    """Ask for the rectangular reference object spanned by the four plane corners."""
+    ref_obj = select_reference_object()
+    if ref_obj and ref_obj.get("length") and not ref_obj.get("width"):
+        from tkinter import simpledialog
+        width = run_dialog(simpledialog.askfloat, "Plane Reference",
+                           f"Width of {ref_obj['name']} ({ref_obj.get('unit', 'mm')}):")
+        if width:
+            ref_obj["width"] = width
+    return ref_obj if ref_obj and ref_obj.get("length") and ref_obj.get("width") else None
+
+def toggle_plane_mode():
+    """Start (or cancel) marking the four corners of a known rectangle on a plane, or remove the plane."""
+    global plane_mode, image_plane, show_rectified, needs_redraw
+    if image_plane is not None and not plane_mode:
+        image_plane = None
+        show_rectified = False
+        rectify_measurements(measurements, None)
+        invalidate_overlay()
+        print("Plane calibration removed.")
+        # Every measurement changed: write a fresh snapshot rather than journaling each one
+        save_measurements()
+        needs_redraw = True
+        update_display()
+        return
+    
+    plane_mode = not plane_mode
+    plane_points.clear()
+    needs_redraw = True
+    update_display()
+    if plane_mode:
+        print("Plane calibration: click the four corners of a known rectangle in order around it.")
+    else:
+        print("Plane calibration cancelled.")
+
+def add_plane_point(point):
+    """Record one plane corner; the fourth one completes the plane calibration."""
+    global plane_mode, image_plane, needs_redraw
+    plane_points.append(point)
+    print(f"Plane corner {len(plane_points)}/4")
+    if len(plane_points) < 4:
+        mark_cursor_dirty()
+        return
+    
+    corners = list(plane_points)
+    plane_mode = False
+    plane_points.clear()
+    ref_obj = select_plane_reference()
+    if ref_obj is None:
+        print("Plane calibration needs a reference object with length and width.")
+    else:
+        image_plane = compute_plane(corners, ref_obj)
+        rectify_measurements(measurements, image_plane)
+        invalidate_overlay()
+        print(f"Plane calibrated with {ref_obj['name']}: lengths on that plane are now also shown rectified.")
+        # Every measurement changed: write a fresh snapshot rather than journaling each one
+        save_measurements()
+    needs_redraw = True
+    update_display()
+
+def toggle_rectified_preview():
+    """Toggle the top-down preview of the calibrated plane."""
+    global show_rectified, needs_redraw
+    if image_plane is None:
+        print("No plane calibration. Press 'h' and click the four corners of a known rectangle.")
+        return
+    show_rectified = not show_rectified
+    needs_redraw = True
+    update_display()
+    print(f"Rectified preview {'on' if show_rectified else 'off'}")
+
+def calibrate_image():
+    """Fit one scale to all reference measurements and rescale every measurement with it."""
+    global measurements, image_calibration, needs_redraw
+    calibration = fit_image_scale(measurements)
+    if calibration is None:
+        print("No reference measurements to calibrate from.")
+        return
+    
+    measurements = apply_image_scale(measurements.copy(), calibration)
+    image_calibration = calibration
+    invalidate_overlay()
+    needs_redraw = True
+    update_display()
+    print(f"Image calibrated: {format_calibration(calibration)}")
+    
+    # Every measurement changed: write a fresh snapshot rather than journaling each one
+    save_measurements()
+    if measurement_db is not None:
+        db_sync_image(measurement_db)
+
+def refresh_calibration():
+    """Refit the image calibration after reference measurements changed, or drop it if none are left."""
+    global measurements, image_calibration, needs_redraw
+    if image_calibration is None:
+        return
+    calibration = fit_image_scale(measurements)
+    if calibration is None:
+        # Back to the per-reference scales; pixel-only measurements have no real length again
+        measurements = recompute_measurements(measurements.copy())
+        print("Image calibration removed: no reference measurements left.")
+    else:
+        measurements = apply_image_scale(measurements.copy(), calibration)
+        print(f"Image calibration updated: {format_calibration(calibration)}")
+    image_calibration = calibration
+    invalidate_overlay()
+    needs_redraw = True
+    update_display()
+    
+    # Every measurement changed: write a fresh snapshot rather than journaling each one
+    save_measurements()
+    if measurement_db is not None:
+        db_sync_image(measurement_db)
+
+def get_annotation_scale(width, height):
+    """Get a zoom-independent line/label scale for full-resolution annotated images."""
+    return max(1.0, max(width, height) / 2000)
+
+def iter_annotated_strips(src, entries, strip_height=512):
+    """Yield full-resolution annotated horizontal strips of src, one strip in memory at a time."""
+    height, width = src.shape[:2]
+    style = get_annotation_scale(width, height)
+    
+    # Draw into strips padded with margin rows, so clipping at strip borders never shows
+    margin = int(64 * style)
+    index = build_segment_index(entries)
+    for y_start in range(0, height, strip_height):
+        y_end = min(height, y_start + strip_height)
+        pad_start = max(0, y_start - margin)
+        pad_end = min(height, y_end + margin)
+        strip = np.array(src[pad_start:pad_end])
+        if strip.ndim == 2:
+            strip = cv2.cvtColor(strip, cv2.COLOR_GRAY2BGR)
+        view = {"zoom": 1.0, "offset_x": 0, "offset_y": -pad_start, "style_scale": style,
+                "measurements": entries, "segment_index": index}
+        draw_measurements(strip, view)
+        yield strip[y_start - pad_start:y_end - pad_start]
+
+def write_png_strips(file_path, width, height, strips, compression=3):
+    """Stream BGR strips into a PNG file without holding the full image in memory."""
+    def write_chunk(f, chunk_type, data):
+        f.write(struct.pack(">I", len(data)) + chunk_type + data)
+        f.write(struct.pack(">I", zlib.crc32(chunk_type + data) & 0xFFFFFFFF))
+    
+    compressor = zlib.compressobj(compression)
+    with open(file_path, "wb") as f:
+        f.write(b"\x89PNG\r\n\x1a\n")
+        write_chunk(f, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))  # 8-bit RGB
+        for strip in strips:
+            # Each PNG row is a filter byte (0 = none) followed by RGB pixels
+            rows = np.zeros((strip.shape[0], 1 + width * 3), dtype=np.uint8)
+            rows[:, 1:] = strip[..., ::-1].reshape(strip.shape[0], -1)
+            data = compressor.compress(rows.tobytes())
+            if data:
+                write_chunk(f, b"IDAT", data)
+        write_chunk(f, b"IDAT", compressor.flush())
+        write_chunk(f, b"IEND", b"")
+
+def export_annotated_image(src, entries, file_path, strip_height=512):
+    """Export src at full resolution with all measurements drawn in image coordinates.
+
+    PNG output is streamed strip by strip, so peak memory stays bounded for any
+    source size; other formats are assembled in memory for cv2.imwrite, up to
+    EXPORT_MAX_IN_MEMORY_PIXELS. Returns False if the file was not written.
+    """
+    height, width = src.shape[:2]
+    strips = iter_annotated_strips(src, entries, strip_height)
+    if file_path.lower().endswith(".png"):
+        write_png_strips(file_path, width, height, strips)
+        return True
+    if width * height > EXPORT_MAX_IN_MEMORY_PIXELS:
+        print(f"Image too large to export as {os.path.splitext(file_path)[1] or 'this format'} "
+              f"({width * height / 1e6:.0f} MP, limit {EXPORT_MAX_IN_MEMORY_PIXELS / 1e6:.0f} MP): "
+              "save it as PNG, which is written in strips.")
+        return False
+    annotated = np.empty((height, width, 3), dtype=np.uint8)
+    for y_start, strip in zip(range(0, height, strip_height), strips):
+        annotated[y_start:y_start + len(strip)] = strip
+    return cv2.imwrite(file_path, annotated)
 
 def save_image():
-    """Save the annotated image."""
-    if image_display is not None:
-        root = tk.Tk()
-        root.withdraw()
+    """Save the image with all measurements at full resolution."""
+    if image is not None and image_source_scale != 1:
+        print("Full-resolution image is still loading, please try again in a moment.")
+    elif image is not None:
+        from tkinter import filedialog
         default_name = f"{os.path.splitext(os.path.basename(current_image_path))[0]}_annotated.png"
-        file_path = filedialog.asksaveasfilename(
+        file_path = run_dialog(
+            filedialog.asksaveasfilename,
             defaultextension='.png', 
-            initialname=default_name,
+            initialfile=default_name,
             filetypes=[('PNG', '*.png'), ('JPEG', '*.jpg')]
         )
-        if file_path:
-            cv2.imwrite(file_path, image_display)
+        if file_path and export_annotated_image(image, measurements, file_path):
             print(f"Annotated image saved: {file_path}")
+        elif file_path:
+            print(f"Annotated image not saved: {file_path}")
     else:
         print("No image to save.")
 
 def export_measurements():
     """Export measurements as CSV for further analysis."""
-    if not measurements:
+    if not len(measurements):
         print("No measurements to export.")
         return
     
-    root = tk.Tk()
-    root.withdraw()
+    from tkinter import filedialog
     default_name = f"{os.path.splitext(os.path.basename(current_image_path))[0]}_measurements.csv"
-    file_path = filedialog.asksaveasfilename(
+    file_path = run_dialog(
+        filedialog.asksaveasfilename,
         defaultextension='.csv',
-        initialname=default_name,
+        initialfile=default_name,
         filetypes=[('CSV', '*.csv')]
     )
     
     if file_path:
-        import csv
-        with open(file_path, 'w', newline='', encoding='utf-8') as csvfile:
-            fieldnames = ['ID', 'Pixel_Length', 'Real_Length', 'Unit', 'Reference_Object', 'Scale_Factor', 'Start_X', 'Start_Y', 'End_X', 'End_Y', 'Timestamp']
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
-            writer.writeheader()
-            
-            for m in measurements:
-                row = {
-                    'ID': m['id'],
-                    'Pixel_Length': m['pixel_length'],
-                    'Real_Length': m.get('real_world_length', ''),
-                    'Unit': m['reference_object'].get('unit', '') if m.get('reference_object') else '',
-                    'Reference_Object': m['reference_object'].get('name', '') if m.get('reference_object') else 'None',
-                    'Scale_Factor': m.get('scale_factor', ''),
-                    'Start_X': m['start']['x'],
-                    'Start_Y': m['start']['y'],
-                    'End_X': m['end']['x'],
-                    'End_Y': m['end']['y'],
-                    'Timestamp': m['timestamp']
-                }
-                writer.writerow(row)
+        write_measurements_csv(file_path, measurements, image_calibration["unit"] if image_calibration else "")
         print(f"Measurements exported as CSV: {file_path}")
 
+def write_measurements_csv(file_path, entries, calibration_unit=""):
+    """Write measurements as CSV (the format of export_measurements).
+
+    calibration_unit is the unit of measurements scaled only by an image calibration.
+    """
+    import csv
+    with open(file_path, 'w', newline='', encoding='utf-8') as csvfile:
+        fieldnames = ['ID', 'Pixel_Length', 'Real_Length', 'Unit', 'Reference_Object', 'Scale_Factor', 'Start_X', 'Start_Y', 'End_X', 'End_Y', 'Timestamp', 'Rectified_Length']
+        writer = csv.DictWriter(csvfile, fieldnames=fieldnames)
+        writer.writeheader()
+        
+        for m in measurements_to_dicts(entries):
+            row = {
+                'ID': m['id'],
+                'Pixel_Length': m['pixel_length'],
+                'Real_Length': m.get('real_world_length', ''),
+                'Unit': m['reference_object'].get('unit', '') if m.get('reference_object') else
+                        calibration_unit if m.get('real_world_length') is not None else '',
+                'Reference_Object': m['reference_object'].get('name', '') if m.get('reference_object') else 'None',
+                'Scale_Factor': m.get('scale_factor', ''),
+                'Start_X': m['start']['x'],
+                'Start_Y': m['start']['y'],
+                'End_X': m['end']['x'],
+                'End_Y': m['end']['y'],
+                'Timestamp': m.get('timestamp', ''),
+                'Rectified_Length': m.get('rectified_length', '')
+            }
+            writer.writerow(row)
+
+def file_digest(path):
+    """Compute a stable SHA-256 digest of a file via a memory map, without copying it into Python."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size > 0:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                digest.update(mapped)
+    return digest.hexdigest()
+
+def get_image_digest(file_path, raster=None):
+    """Get the digest identifying an image file: the SHA-256 of the whole file, or for huge
+    memory-mapped rasters (where hashing would take longer than opening) a sampled one."""
+    size = os.path.getsize(file_path)
+    if size >= SAMPLED_DIGEST_MIN_BYTES and raster is None:
+        raster = open_mapped_raster(file_path)
+    if size < SAMPLED_DIGEST_MIN_BYTES or raster is None:
+        return file_digest(file_path)
+    
+    # Size plus evenly spaced blocks including the first and the last one
+    digest = hashlib.sha256(str(size).encode())
+    with open(file_path, "rb") as f:
+        for offset in np.linspace(0, size - SAMPLED_DIGEST_BLOCK_SIZE, SAMPLED_DIGEST_BLOCKS).astype(np.int64):
+            f.seek(int(offset))
+            digest.update(f.read(SAMPLED_DIGEST_BLOCK_SIZE))
+    return "sampled-" + digest.hexdigest()
+
+def open_measurement_db(path):
+    """Open (and create if needed) the SQLite measurement store with its indexes."""
+    conn = sqlite3.connect(path)
+    conn.executescript("""
+        CREATE TABLE IF NOT EXISTS measurements (
+            image_digest TEXT NOT NULL,
+            image_path TEXT,
+            measurement_id INTEGER NOT NULL,
+            start_x REAL, start_y REAL, end_x REAL, end_y REAL,
+            pixel_length REAL,
+            reference_object TEXT,
+            reference_data TEXT,
+            unit TEXT,
+            real_world_length REAL,
+            scale_factor REAL,
+            timestamp TEXT,
+            PRIMARY KEY (image_digest, measurement_id)
+        );
+        CREATE INDEX IF NOT EXISTS idx_measurements_reference ON measurements (reference_object, scale_factor);
+        CREATE INDEX IF NOT EXISTS idx_measurements_scale ON measurements (scale_factor);
+        CREATE INDEX IF NOT EXISTS idx_measurements_timestamp ON measurements (timestamp);
+    """)
+    return conn
+
+def db_row(image_digest, image_path, m):
+    """Convert a measurement record into a database row."""
+    ref_obj = m.get("reference_object")
+    return (
+        image_digest, image_path, m["id"],
+        m["start"]["x"], m["start"]["y"], m["end"]["x"], m["end"]["y"],
+        m["pixel_length"],
+        ref_obj.get("name") if ref_obj else None,
+        json.dumps(ref_obj, ensure_ascii=False) if ref_obj else None,
+        ref_obj.get("unit") if ref_obj else None,
+        m.get("real_world_length"),
+        m.get("scale_factor"),
+        m.get("timestamp")
+    )
+
+DB_INSERT = "INSERT OR REPLACE INTO measurements VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+
+def db_apply_record(conn, record):
+    """Apply one journal record (add/update/delete) for the current image to the database."""
+    with conn:
+        if record["op"] in ("add", "update"):
+            conn.execute(DB_INSERT, db_row(current_image_digest, current_image_path, record["measurement"]))
+        elif record["op"] == "delete":
+            conn.execute("DELETE FROM measurements WHERE image_digest = ? AND measurement_id = ?",
+                         (current_image_digest, record["id"]))
+
+def db_sync_image(conn):
+    """Replace the database rows of the current image with its loaded measurements."""
+    with conn:
+        conn.execute("DELETE FROM measurements WHERE image_digest = ?", (current_image_digest,))
+        conn.executemany(DB_INSERT, [db_row(current_image_digest, current_image_path, m)
+                                       for m in measurements_to_dicts(measurements)])
+
+def find_measurement_files(paths):
+    """Find *_measurements.json files in the given files and directories (recursively)."""
+    for path in paths:
+        if os.path.isdir(path):
+            for dir_path, _, file_names in os.walk(path):
+                for file_name in sorted(file_names):
+                    if file_name.endswith("_measurements.json"):
+                        yield os.path.join(dir_path, file_name)
+        else:
+            yield path
+
+def db_import(conn, paths):
+    """Bulk import existing _measurements.json files into the database."""
+    files = 0
+    rows = 0
+    with conn:
+        for json_path in find_measurement_files(paths):
+            try:
+                with open(json_path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"Skipping {json_path}: {e}")
+                continue
+            
+            image_path = data.get("image_path") or ""
+            image_digest = data.get("image_digest")
+            if not image_digest:
+                # Older files carry no digest: hash the image if it is still there
+                image_digest = get_image_digest(image_path) if os.path.isfile(image_path) else f"path:{image_path}"
+            
+            entries = data.get("measurements", [])
+            conn.executemany(DB_INSERT, [db_row(image_digest, image_path, m) for m in entries])
+            files += 1
+            rows += len(entries)
+    print(f"Imported {rows} measurements from {files} files.")
+
+def db_query(conn, reference=None, min_scale=None, max_scale=None, image_digest=None, since=None, until=None):
+    """Query measurements across the case; all filters are optional and use the indexes."""
+    conditions = []
+    params = []
+    if reference:
+        conditions.append("reference_object = ?")
+        params.append(reference)
+    if min_scale is not None:
+        conditions.append("scale_factor >= ?")
+        params.append(min_scale)
+    if max_scale is not None:
+        conditions.append("scale_factor <= ?")
+        params.append(max_scale)
+    if image_digest:
+        conditions.append("image_digest = ?")
+        params.append(image_digest)
+    if since:
+        conditions.append("timestamp >= ?")
+        params.append(since)
+    if until:
+        conditions.append("timestamp <= ?")
+        params.append(until)
+    
+    sql = "SELECT * FROM measurements"
+    if conditions:
+        sql += " WHERE " + " AND ".join(conditions)
+    sql += " ORDER BY image_path, measurement_id"
+    conn.row_factory = sqlite3.Row
+    return conn.execute(sql, params).fetchall()
+
+def run_db_command(args):
+    """Run the 'db import' / 'db query' subcommands."""
+    conn = open_measurement_db(args.database)
+    try:
+        if args.db_command == "import":
+            db_import(conn, args.paths)
+        elif args.db_command == "query":
+            rows = db_query(conn, args.reference, args.min_scale, args.max_scale,
+                            args.digest, args.since, args.until)
+            if args.csv:
+                import csv
+                with open(args.csv, "w", newline="", encoding="utf-8") as csvfile:
+                    writer = csv.writer(csvfile)
+                    writer.writerow(rows[0].keys() if rows else [])
+                    writer.writerows(tuple(row) for row in rows)
+                print(f"{len(rows)} measurements exported as CSV: {args.csv}")
+            else:
+                for row in rows:
+                    real = f"{row['real_world_length']:.2f} {row['unit']}" if row["real_world_length"] else "-"
+                    scale = f"{row['scale_factor']:.4f}" if row["scale_factor"] else "-"
+                    print(f"{row['image_path']} #{row['measurement_id']}: {row['pixel_length']:.2f} px, "
+                          f"{real}, scale {scale}, ref {row['reference_object'] or 'None'}, {row['timestamp']}")
+                print(f"{len(rows)} measurements found.")
+    finally:
+        conn.close()
+
+IMAGE_EXTENSIONS = (".jpg", ".jpeg", ".png", ".bmp", ".tif", ".tiff")
+
+def get_image_extensions():
+    """Get the extensions of image files in folders (raw dumps only with --raw)."""
+    return IMAGE_EXTENSIONS + RAW_EXTENSIONS if raw_format else IMAGE_EXTENSIONS
+
+def find_batch_jobs(image_dir, measurements_dir=None):
+    """Pair images in image_dir with their measurement files; returns (jobs, skipped image paths).
+
+    An explicit measurements_dir wins over sidecars next to the images; images without either
+    are looked up by digest in the measurement store (used for read-only image folders).
+    """
+    jobs, skipped = [], []
+    for file_name in sorted(os.listdir(image_dir)):
+        base_name, ext = os.path.splitext(file_name)
+        if ext.lower() not in get_image_extensions():
+            continue
+        image_path = os.path.join(image_dir, file_name)
+        candidates = [os.path.join(directory, f"{base_name}_measurements.json")
+                      for directory in (measurements_dir, image_dir) if directory]
+        json_path = next((path for path in candidates if os.path.isfile(path)), None)
+        if json_path is None and os.path.isdir(MEASUREMENT_STORE_DIR):
+            store_path = os.path.join(MEASUREMENT_STORE_DIR, f"{get_image_digest(image_path)}_measurements.json")
+            json_path = store_path if os.path.isfile(store_path) else None
+        if json_path is None:
+            skipped.append(image_path)
+        else:
+            jobs.append((image_path, json_path))
+    return jobs, skipped
+
+def batch_process_image(job):
+    """Recompute, render and export one image with its measurements (runs in a worker process)."""
+    image_path, json_path, output_dir, calibrate = job
+    base_name = os.path.splitext(os.path.basename(image_path))[0]
+    try:
+        with open(json_path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        # Changes since the last snapshot are only in the journal (e.g. after a crash)
+        entries = data.get("measurements", [])
+        journal_path = json_path[:-len(".json")] + ".journal.jsonl"
+        if os.path.exists(journal_path):
+            replay_journal(entries, journal_path)
+        entries = recompute_measurements(measurements_from_dicts(entries))
+        calibration = fit_image_scale(entries) if calibrate else data.get("calibration")
+        if calibration:
+            apply_image_scale(entries, calibration)
+            data["calibration"] = calibration
+        else:
+            # Nothing to fit from: don't claim a stored calibration the lengths don't reflect
+            data.pop("calibration", None)
+        data["measurements"] = measurements_to_dicts(entries)
+        
+        img = read_image(image_path)
+        if img is None:
+            return image_path, 0, "failed to load image", None
+        
+        # Same drawing rules as the interactive full-resolution export
+        export_annotated_image(img, entries, os.path.join(output_dir, f"{base_name}_annotated.png"))
+        
+        write_measurements_csv(os.path.join(output_dir, f"{base_name}_measurements.csv"), entries,
+                               calibration["unit"] if calibration else "")
+        with open(os.path.join(output_dir, f"{base_name}_measurements.json"), "w", encoding="utf-8") as f:
+            json.dump(data, f, indent=4, ensure_ascii=False)
+        return image_path, len(entries), None, calibration
+    except Exception as e:
+        return image_path, 0, str(e), None
+
+def init_batch_worker(raw=None):
+    """Keep OpenCV single-threaded inside worker processes; the pool provides the parallelism."""
+    global raw_format
+    cv2.setNumThreads(1)
+    raw_format = raw
+
+def run_batch_command(args):
+    """Run the 'batch' subcommand: process a directory of images headlessly in parallel."""
+    output_dir = args.output or os.path.join(args.image_dir, "pixelruler_output")
+    os.makedirs(output_dir, exist_ok=True)
+    jobs, skipped = find_batch_jobs(args.image_dir, args.measurements_dir)
+    if skipped:
+        print(f"Skipping {len(skipped)} images without measurements: "
+              f"{', '.join(os.path.basename(path) for path in skipped)}")
+    if not jobs:
+        print("No images with measurement files found.")
+        return
+    
+    print(f"Processing {len(jobs)} images with {args.workers or os.cpu_count()} workers...")
+    start_time = time.monotonic()
+    failed = 0
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(max_workers=args.workers, initializer=init_batch_worker,
+                             initargs=(raw_format,)) as pool:
+        batch_jobs = [(image_path, json_path, output_dir, args.calibrate) for image_path, json_path in jobs]
+        for image_path, count, error, calibration in pool.map(batch_process_image, batch_jobs):
+            if error:
+                failed += 1
+                print(f"  {os.path.basename(image_path)}: ERROR {error}")
+            elif calibration:
+                print(f"  {os.path.basename(image_path)}: {count} measurements, {format_calibration(calibration)}")
+            else:
+                print(f"  {os.path.basename(image_path)}: {count} measurements")
+    print(f"Done in {time.monotonic() - start_time:.1f}s, {len(jobs) - failed} ok, {failed} failed. Output: {output_dir}")
+
+def run_calibrate_command(args):
+    """Run the 'calibrate' subcommand: fit one scale per measurement file across a case."""
+    for json_path in find_measurement_files(args.paths):
+        try:
+            with open(json_path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Skipping {json_path}: {e}")
+            continue
+        
+        table = recompute_measurements(measurements_from_dicts(data.get("measurements", [])))
+        calibration = fit_image_scale(table)
+        if calibration is None:
+            print(f"  {json_path}: no reference measurements")
+            continue
+        print(f"  {json_path}: {format_calibration(calibration)}")
+        
+        if args.write:
+            if os.path.exists(json_path[:-len(".json")] + ".journal.jsonl"):
+                print("    not written: pending journal, open the image in PixelRuler first")
+                continue
+            data["measurements"] = measurements_to_dicts(apply_image_scale(table, calibration))
+            data["calibration"] = calibration
+            write_json_atomic(json_path, data)
+
 def reset_view():
     """Reset zoom and position."""
-    global zoom_factor, offset_x, offset_y, needs_redraw, cached_scaled_image, cached_zoom
-    zoom_factor = 1.0
+    global zoom_factor, offset_x, offset_y, needs_redraw
+    if image is None:
+        return
+    zoom_factor = get_fit_zoom()
     offset_x = 0
     offset_y = 0
-    cached_scaled_image = None
-    cached_zoom = 0
     needs_redraw = True
     update_display()
     print("View reset.")
 
-def main():
+def parse_args(argv=None):
+    """Parse command-line options."""
+    parser = argparse.ArgumentParser(description="PixelRuler - OSINT Image Measurement Tool")
+    parser.add_argument("--window", metavar="WxH", type=parse_window_size,
+                        help="fixed viewport size (default: fit image to screen)")
+    parser.add_argument("--fps", type=int, default=fps_cap,
+                        help=f"frame rate cap for redraws (default: {fps_cap})")
+    parser.add_argument("--session", metavar="PATH",
+                        help="open a folder or a text file listing images as a session")
+    parser.add_argument("--db", metavar="CASE.sqlite",
+                        help="also record measurements in a SQLite case database")
+    parser.add_argument("--raw", metavar="WxH[xC]", type=parse_raw_shape,
+                        help="open .raw/.bin files as headerless interleaved rasters of this shape "
+                             "(grey or RGB, optionally with alpha; default C = 3)")
+    parser.add_argument("--raw-dtype", choices=("uint8", "uint16"), default="uint8",
+                        help="sample type of raw files, little-endian (default: uint8)")
+    parser.add_argument("--raw-offset", type=int, default=0, metavar="BYTES",
+                        help="header bytes to skip in raw files (default: 0)")
+    parser.add_argument("--trace", metavar="FILE", default=os.environ.get(TRACE_ENV),
+                        help=f"write per-frame render timings as a Chrome trace (also ${TRACE_ENV})")
+    
+    subparsers = parser.add_subparsers(dest="command")
+    db_parser = subparsers.add_parser("db", help="manage a SQLite case database")
+    db_subparsers = db_parser.add_subparsers(dest="db_command", required=True)
+    
+    import_parser = db_subparsers.add_parser("import", help="bulk import _measurements.json files")
+    import_parser.add_argument("database", help="SQLite database file")
+    import_parser.add_argument("paths", nargs="+", help="measurement files or directories to scan")
+    
+    query_parser = db_subparsers.add_parser("query", help="query measurements across the case")
+    query_parser.add_argument("database", help="SQLite database file")
+    query_parser.add_argument("--reference", help="reference object name, e.g. 'Credit Card'")
+    query_parser.add_argument("--min-scale", type=float, help="minimum scale factor (unit per px)")
+    query_parser.add_argument("--max-scale", type=float, help="maximum scale factor (unit per px)")
+    query_parser.add_argument("--digest", help="image SHA-256 digest")
+    query_parser.add_argument("--since", help="earliest timestamp (ISO format)")
+    query_parser.add_argument("--until", help="latest timestamp (ISO format)")
+    query_parser.add_argument("--csv", metavar="FILE", help="write results as CSV instead of printing")
+    
+    batch_parser = subparsers.add_parser("batch", help="re-render and export a directory of images headlessly")
+    batch_parser.add_argument("image_dir", help="directory with images")
+    batch_parser.add_argument("--measurements-dir", help="directory with _measurements.json files, preferred over sidecars next to the images")
+    batch_parser.add_argument("--output", help="output directory (default: image_dir/pixelruler_output)")
+    batch_parser.add_argument("--workers", type=int, help="worker processes (default: all cores)")
+    batch_parser.add_argument("--calibrate", action="store_true",
+                              help="fit one scale per image from its reference measurements and rescale all measurements")
+    
+    calibrate_parser = subparsers.add_parser("calibrate", help="fit one scale per image from its reference measurements")
+    calibrate_parser.add_argument("paths", nargs="+", help="measurement files or directories to scan")
+    calibrate_parser.add_argument("--write", action="store_true",
+                                  help="rescale all measurements and write the calibration into the files")
+    return parser.parse_args(argv)
+
+def main(argv=None):
     """Main program function."""
-    global window_name
+    global window_name, window_size, fps_cap, measurement_db, raw_format, loop_wait_deadline
+    start = time.perf_counter()
+    args = parse_args(argv)
+    if args.raw:
+        width, height, channels = args.raw
+        raw_format = {"width": width, "height": height, "channels": channels,
+                      "dtype": args.raw_dtype, "offset": args.raw_offset}
+    if args.command == "db":
+        run_db_command(args)
+        return
+    if args.command == "batch":
+        run_batch_command(args)
+        return
+    if args.command == "calibrate":
+        run_calibrate_command(args)
+        return
+    
+    window_size = args.window
+    fps_cap = max(1, args.fps)
+    if args.db:
+        measurement_db = open_measurement_db(args.db)
+    if args.trace:
+        open_trace(args.trace, start)
+    
     cv2.namedWindow(window_name, cv2.WINDOW_AUTOSIZE)
     cv2.setMouseCallback(window_name, mouse_callback)
+    start_render_thread()
 
     print("=== OSINT Measurement Tool (CPU Optimized) ===")
     print("\nControls:")
     print("  'l': Load image")
+    print("  'o': Open folder as session")
+    print("  'n' / 'p': Next / previous image of the session")
     print("  Left click: Set measurement points (2 points = 1 measurement)")
     print("  Ctrl + Mouse wheel: Zoom around mouse position")
     print("  Ctrl + Left click + Drag: Pan image")
     print("  't': Toggle measurement display")
     print("  'd': Delete last measurement")
+    print("  Shift + Left click: Select line / Shift + drag endpoint: Move it")
+    print("  'x': Delete selected measurements")
     print("  'm': Show measurement list")
+    print("  'c': Calibrate image scale from all reference measurements")
+    print("  'f': Auto-detect reference objects (cards, phones, coins)")
+    print("  'h': Calibrate a plane from four corners of a known rectangle (again: remove it)")
+    print("  'v': Toggle rectified (top-down) preview of the calibrated plane")
     print("  's': Save annotated image")
     print("  'e': Export measurements as CSV")
+    print("  'z': Toggle magnifier loupe")
+    print("  'g': Toggle snapping of points to edges and corners")
+    print("  'i': Show render statistics (stage timings, cache hits)")
     print("  'r': Reset view")
     print("  'q': Quit program")
     print("\nPerformance optimizations:")
-    print("  - Cached image scaling")
-    print("  - Throttled updates during panning")
+    print("  - Viewport-only image scaling")
+    print("  - Tile pyramid with LRU tile cache")
+    print("  - Reusable window-sized frame buffer")
+    print("  - Cached measurement overlay layer")
+    print("  - Columnar measurement store with vectorized recomputation")
+    print("  - Dirty-rectangle cursor layer (rubber band, loupe)")
+    print("  - Background rendering with preview from cached levels")
+    print("  - Progressive loading of large JPEGs")
+    print("  - Memory-mapped windowed reading of large uncompressed TIFF/raw rasters")
+    print("  - Background prefetch of neighbouring session images")
+    print("  - Frame-paced, coalesced redraws with idle back-off")
     print("  - Adaptive interpolation methods")
     print("  - Reduced unnecessary redraws")
     print("\nAvailable reference objects:")
@@ -591,17 +3529,54 @@ def main():
     cv2.putText(empty_img, "Press 'l' to load an image", (50, 200), 
                 cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
     cv2.imshow(window_name, empty_img)
+    trace_event("startup", start)
+    if args.session:
+        open_session(args.session)
 
     while True:
-        key = cv2.waitKey(1) & 0xFF
+        wait_ms = get_wait_time()
+        loop_wait_deadline = time.monotonic() + wait_ms / 1000
+        key = cv2.waitKey(wait_ms) & 0xFF
+        loop_wait_deadline = 0.0
+        if key != 0xFF:
+            mark_activity()
+        
+        # Swap in a finished background decode, flush a coalesced redraw,
+        # then show the latest rendered frame
+        apply_pending_decode()
+        update_display()
+        present_frame()
+        
         if key == ord('l'):
             load_image()
+        elif key == ord('o'):
+            open_session_dialog()
+        elif key == ord('n'):
+            step_session(1)
+        elif key == ord('p'):
+            step_session(-1)
         elif key == ord('t'):
             toggle_measurements()
         elif key == ord('d'):
             delete_last_measurement()
+        elif key == ord('g'):
+            toggle_snap()
+        elif key == ord('z'):
+            toggle_loupe()
+        elif key == ord('x'):
+            delete_selected_measurements()
+        elif key == ord('h'):
+            toggle_plane_mode()
+        elif key == ord('v'):
+            toggle_rectified_preview()
+        elif key == ord('f'):
+            auto_detect_references()
+        elif key == ord('c'):
+            calibrate_image()
         elif key == ord('m'):
             show_measurement_list()
+        elif key == ord('i'):
+            show_render_stats()
         elif key == ord('s'):
             save_image()
         elif key == ord('e'):
@@ -609,9 +3584,14 @@ def main():
         elif key == ord('r'):
             reset_view()
         elif key == ord('q'):
+            if journal_records:
+                save_measurements()
             print("Program terminated.")
             break
 
+    close_trace()
+    if tk_root is not None:
+        tk_root.destroy()
     cv2.destroyAllWindows()
 
 if __name__ == "__main__":